@@ -5,6 +5,8 @@
 # - Accepts multiple input payload shapes: {"data":[...]}, {"instances":[...]}, {"records":[...]},
 #   {"input_data":{"data":[...]}} as seen in your previous runs.
 # - Predicts and returns a normalized response. If model load/predict fails, runs rule-based fallback.
+# - If xgboost_pipeline.onnx sits next to the pickle and onnxruntime is installed, inference runs
+#   through ONNX Runtime; the joblib pipeline remains the fallback.
 #
 # Response shape (example):
 # {
@@ -33,7 +35,12 @@
 import os
 import io
 import json
+import time
+import queue
+import threading
 import traceback
+from collections import namedtuple
+from concurrent.futures import Future
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Tuple, Optional
 
@@ -47,6 +54,23 @@ try:
 except Exception:
     xgboost = None  # model load may still work if xgboost is not required during unpickle
 
+# Optional fast JSON: orjson parses requests and pre-serializes responses (numpy-aware)
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    from azureml.contrib.services.aml_response import AMLResponse
+except Exception:
+    AMLResponse = None
+
+# Optional JIT for the batched rules fallback
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
 # ----------------------------
 # Globals initialized in init()
 # ----------------------------
@@ -54,6 +78,39 @@ MODEL: Optional[Any] = None
 MODEL_VERSION: Optional[str] = None
 CLASS_NAMES: Optional[List[str]] = None
 EXPECTED_FEATURES: Optional[List[str]] = None  # best-effort extraction from ColumnTransformer
+FEATURE_ORDER: Optional[List[str]] = None  # positional input order for the compiled single-row path
+FAST_PREDICT: Optional[Any] = None  # Stripje-compiled pipeline (optional dependency)
+ONNX_SESSION: Optional[Any] = None  # onnxruntime.InferenceSession over xgboost_pipeline.onnx (optional)
+ONNX_INPUTS: Optional[List[Tuple[str, bool]]] = None  # (input name, is_string) per graph input
+ONNX_PROBA_OUTPUT: Optional[str] = None
+EXPECTED_SET: frozenset = frozenset()
+NAME_MAP: Optional[Dict[int, str]] = None  # encoded class value -> CLASS_NAMES entry
+CLASS_KEYS: Optional[List[str]] = None  # probability column labels in model.classes_ order
+
+# Opt-in: score through the pipeline's preprocessing + raw xgboost Booster (SCORE_DIRECT_BOOSTER=1)
+DIRECT_BOOSTER = os.getenv("SCORE_DIRECT_BOOSTER") == "1"
+BOOSTER: Optional[Any] = None
+PREPROCESSOR: Optional[Any] = None
+
+# (missing, extra) per observed input schema; clients send a stable schema so this stays tiny
+_DIFF_CACHE: Dict[frozenset, Tuple[List[str], List[str]]] = {}
+_DIFF_CACHE_MAX = 32
+
+# Attach formatted tracebacks to error responses (off by default in prod)
+INCLUDE_TRACE = os.getenv("INCLUDE_TRACE") == "1"
+
+# Micro-batching: coalesce concurrent requests into one model call (disabled when 0)
+MICROBATCH_MS = float(os.getenv("SCORE_MICROBATCH_MS", "0") or 0)
+MICROBATCH_MAX_ROWS = int(os.getenv("SCORE_MICROBATCH_MAX_ROWS", "32") or 32)
+_BATCH_QUEUE: Optional["queue.Queue[Tuple[List[Dict[str, Any]], Future]]"] = None
+_BATCH_LOCK = threading.Lock()
+
+# Common numeric telemetry fields (must match training)
+NUMERIC_HINT_COLS = frozenset([
+    "RuntimeHours", "TemperatureC", "PressureKPa", "VibrationMM_S",
+    "CurrentDrawA", "SignalNoiseLevel", "HumidityPercent", "OperationalCycles",
+    "UserInteractionsPerDay", "ApproxDeviceAgeYears", "NumRepairs", "ErrorLogsCount",
+])
 
 
 # ---------- Utilities ----------
@@ -62,26 +119,73 @@ def _utcnow_iso() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+_PING_BODIES = (b"ping", b'"ping"')
+
+
+def _is_ping(raw: Any) -> bool:
+    """Prefix sniff for health probes; anything longer than a padded ping is a real payload."""
+    if len(raw) > 16:
+        return False
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8", errors="ignore")
+    return bytes(raw).strip().lower() in _PING_BODIES
+
+
+def _loads(raw: Any) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _respond(result: Dict[str, Any]) -> Any:
+    """
+    Hand the response back to the inference server. With orjson and AMLResponse available
+    the body is serialized here in one C pass (numpy scalars included) and passed through
+    untouched; otherwise return the dict and let the server encode it.
+    """
+    if orjson is None or AMLResponse is None:
+        return result
+    body = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=str)
+    return AMLResponse(body.decode("utf-8"), 200, json_str=True)
+
+
 def _read_text_if_exists(path: str) -> Optional[str]:
     try:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read().strip()
-    except Exception:
-        pass
-    return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except (FileNotFoundError, OSError):
+        return None
+
+
+MODEL_FILE_NAMES = ("xgboost_pipeline.pkl", "model.pkl", "pipeline.pkl")
 
 
 def _find_model_file(base_dir: str) -> Optional[str]:
     """
     Try to find the model file under AZUREML_MODEL_DIR (or current working dir).
-    We look for common names and .pkl files.
+    Azure mounts the model at a known location, so check the common names directly
+    (base_dir, base_dir/outputs, then one level of subfolders) before falling back
+    to a full os.walk for any .pkl file.
     """
+    for folder in (base_dir, os.path.join(base_dir, "outputs")):
+        for name in MODEL_FILE_NAMES:
+            p = os.path.join(folder, name)
+            if os.path.isfile(p):
+                return p
+
+    # One level deep (e.g. AZUREML_MODEL_DIR/<model-name>/xgboost_pipeline.pkl)
+    try:
+        subdirs = [e.path for e in os.scandir(base_dir) if e.is_dir()]
+    except OSError:
+        subdirs = []
+    for name in MODEL_FILE_NAMES:
+        for folder in subdirs:
+            p = os.path.join(folder, name)
+            if os.path.isfile(p):
+                return p
+
     candidates = []
     for root, _, files in os.walk(base_dir):
         for fn in files:
-            lower = fn.lower()
-            if lower in ("xgboost_pipeline.pkl", "model.pkl", "pipeline.pkl") or lower.endswith(".pkl"):
+            if fn.lower().endswith(".pkl"):
                 candidates.append(os.path.join(root, fn))
     # Prefer the exact expected name if present
     for preferred in candidates:
@@ -167,62 +271,311 @@ def _extract_items(payload: Any) -> List[Dict[str, Any]]:
 def _coerce_features(df: pd.DataFrame) -> pd.DataFrame:
     """
     Coerce dtypes but keep names. We don't enforce exact schema here because the
-    ColumnTransformer in the pipeline will select its columns by name.
-    - Numeric-like columns will be converted with errors='ignore' to avoid breaking strings.
-    - Common numeric telemetry fields explicitly coerced.
-    """
-    numeric_hint_cols = [
-        "RuntimeHours", "TemperatureC", "PressureKPa", "VibrationMM_S",
-        "CurrentDrawA", "SignalNoiseLevel", "HumidityPercent", "OperationalCycles",
-        "UserInteractionsPerDay", "ApproxDeviceAgeYears", "NumRepairs", "ErrorLogsCount"
-    ]
-    for col in df.columns:
-        # explicit numeric attempt for known columns
-        if col in numeric_hint_cols:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-        # best-effort: if column looks numeric (all digits/float-like), to_numeric
-        elif df[col].dtype == object:
-            try_sample = df[col].dropna().astype(str).head(10)
-            if len(try_sample) > 0 and all(any(ch.isdigit() for ch in s) for s in try_sample):
-                df[col] = pd.to_numeric(df[col], errors="ignore")
+    ColumnTransformer in the pipeline will select its columns by name (and already
+    knows which columns are numeric), so only the known numeric telemetry fields
+    are converted, in one pd.to_numeric pass.
+    """
+    cols = [c for c in df.columns if c in NUMERIC_HINT_COLS]
+    if cols:
+        df[cols] = df[cols].apply(pd.to_numeric, errors="coerce")
     return df
 
 
+def _schema_diff(items: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    Missing/extra feature names relative to EXPECTED_FEATURES, cached by the request's
+    key set so the set differences and sorts run once per schema, not once per request.
+    """
+    key = frozenset(items[0]) if len(items) == 1 else frozenset().union(*items)
+    cached = _DIFF_CACHE.get(key)
+    if cached is None:
+        cached = (sorted(EXPECTED_SET - key), sorted(key - EXPECTED_SET))
+        if len(_DIFF_CACHE) >= _DIFF_CACHE_MAX:
+            _DIFF_CACHE.clear()
+        _DIFF_CACHE[key] = cached
+    return cached
+
+
+def _build_feature_frame(items: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Build the model input. With a known FEATURE_ORDER this is a structure-of-arrays build:
+    one typed column per feature (float64 with NaN for numerics, object for categoricals),
+    filled in a single pass and wrapped once, skipping pandas dict->DataFrame inference and
+    the per-column coercion pass. Missing features come out as NaN for the imputers.
+    """
+    if not FEATURE_ORDER:
+        df = pd.DataFrame(items)
+        df = _coerce_features(df)
+        # Create placeholders for missing features (None/NaN); the pipeline's imputers/scalers should handle
+        for m in EXPECTED_FEATURES or []:
+            if m not in df.columns:
+                df[m] = np.nan
+        return df
+
+    n = len(items)
+    columns: Dict[str, np.ndarray] = {}
+    for col in FEATURE_ORDER:
+        values = [_feature_value(col, row.get(col)) for row in items]
+        if col in NUMERIC_HINT_COLS:
+            arr = np.array(values, dtype=float)
+        else:
+            arr = np.empty(n, dtype=object)
+            arr[:] = values
+        columns[col] = arr
+    return pd.DataFrame(columns, copy=False)
+
+
+def _feature_value(col: str, v: Any) -> Any:
+    """
+    One raw field as the model sees it: float (NaN if missing or unparseable) for numeric
+    telemetry, NaN for a missing categorical. Shared by the frame build and the compiled path.
+    """
+    if col in NUMERIC_HINT_COLS:
+        return _to_float_or_nan(v)
+    return np.nan if v is None else v
+
+
 def _get_expected_features_from_pipeline(pipeline) -> Optional[List[str]]:
     """
     Best-effort: find a ColumnTransformer inside the sklearn Pipeline and collect
     the input column names it expects. This helps us report missing/extra fields.
+    Only a short whitelist of attributes is inspected, so fitted-estimator properties
+    are never triggered during introspection.
     """
     try:
         from sklearn.compose import ColumnTransformer
-        from sklearn.pipeline import Pipeline
-
-        if isinstance(pipeline, Pipeline):
-            # look for first ColumnTransformer in steps
-            for name, step in pipeline.steps:
-                if isinstance(step, ColumnTransformer):
-                    cols: List[str] = []
-                    for _, trans, col_list in step.transformers:
-                        if isinstance(col_list, list):
-                            cols.extend(col_list)
-                    return list(dict.fromkeys(cols))  # preserve order, dedupe
-        # Sometimes the pipeline is nested; scan attributes shallowly
-        for attr in dir(pipeline):
-            obj = getattr(pipeline, attr)
-            try:
-                if isinstance(obj, ColumnTransformer):
-                    cols = []
-                    for _, _, col_list in obj.transformers:
-                        if isinstance(col_list, list):
-                            cols.extend(col_list)
-                    return list(dict.fromkeys(cols))
-            except Exception:
+
+        def _columns(ct) -> List[str]:
+            cols: List[str] = []
+            for _, _, col_list in ct.transformers:
+                if isinstance(col_list, list):
+                    cols.extend(col_list)
+            return list(dict.fromkeys(cols))  # preserve order, dedupe
+
+        if isinstance(pipeline, ColumnTransformer):
+            return _columns(pipeline)
+
+        # Pipeline steps first, then known nesting points
+        candidates: List[Any] = []
+        steps = getattr(pipeline, "steps", None)
+        if isinstance(steps, list):
+            candidates.extend(step for _, step in steps)
+        for attr in ("named_steps", "_final_estimator"):
+            obj = getattr(pipeline, attr, None)
+            if obj is None:
                 continue
+            if isinstance(obj, dict) or hasattr(obj, "values"):
+                try:
+                    candidates.extend(obj.values())
+                    continue
+                except Exception:
+                    pass
+            candidates.append(obj)
+
+        for obj in candidates:
+            if isinstance(obj, ColumnTransformer):
+                return _columns(obj)
     except Exception:
         pass
     return None
 
 
+def _fast_predict_proba(row: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    Score a single record through the Stripje-compiled pipeline, skipping pandas entirely.
+    Returns a (1, k) probability array, or None if the fast path is unavailable or fails.
+    """
+    if FAST_PREDICT is None or not FEATURE_ORDER:
+        return None
+    try:
+        values = [_feature_value(col, row.get(col)) for col in FEATURE_ORDER]
+        return np.asarray(FAST_PREDICT(values), dtype=float).reshape(1, -1)
+    except Exception:
+        return None
+
+
+def _compile_fast_predict(model) -> Optional[Any]:
+    """
+    Compile the pipeline with Stripje and keep it only if it returns class probabilities.
+    The output is checked once here on an all-missing row: a compiled predict() yields
+    labels, and scoring those per request would just be discarded work.
+    """
+    if not FEATURE_ORDER:
+        return None
+    from stripje import compile_pipeline
+
+    compiled = compile_pipeline(model)
+    probe = np.asarray(compiled([_feature_value(col, None) for col in FEATURE_ORDER]), dtype=float)
+    if probe.reshape(1, -1).shape[1] < 2:
+        raise ValueError(f"compiled pipeline returns {probe.size} value(s) per row, not class probabilities")
+    return compiled
+
+
+def _load_onnx_session(onnx_path: str) -> None:
+    """
+    Load the ONNX export of the pipeline (written by model_train.py) if onnxruntime is available.
+    Leaves ONNX_SESSION as None otherwise; the joblib pipeline stays the fallback.
+    """
+    global ONNX_SESSION, ONNX_INPUTS, ONNX_PROBA_OUTPUT
+    if not os.path.isfile(onnx_path):
+        return
+    try:
+        import onnxruntime as ort
+
+        session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        ONNX_INPUTS = [(i.name, i.type == "tensor(string)") for i in session.get_inputs()]
+        out_names = [o.name for o in session.get_outputs()]
+        ONNX_PROBA_OUTPUT = next((n for n in out_names if "prob" in n.lower()), out_names[-1])
+        ONNX_SESSION = session
+        print(f"[score.py] ONNX Runtime session loaded from {onnx_path}")
+    except Exception as e:
+        ONNX_SESSION = None
+        print(f"[score.py] ONNX Runtime unavailable, using joblib pipeline: {e}")
+
+
+def _onnx_predict_proba(items: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """
+    Score records through ONNX Runtime. The exported graph takes one [n, 1] input per
+    column (string for categoricals, float32 for numerics); a single dense float input
+    is fed the full [n, k] matrix in FEATURE_ORDER.
+    Returns an (n, k) probability array, or None if the session is unavailable or fails.
+    """
+    if ONNX_SESSION is None or not ONNX_INPUTS:
+        return None
+    n = len(items)
+    try:
+        feeds: Dict[str, np.ndarray] = {}
+        if len(ONNX_INPUTS) == 1 and not ONNX_INPUTS[0][1] and FEATURE_ORDER:
+            arr = np.empty((n, len(FEATURE_ORDER)), dtype=np.float32)
+            arr[:] = [[_to_float_or_nan(row.get(col)) for col in FEATURE_ORDER] for row in items]
+            feeds[ONNX_INPUTS[0][0]] = arr
+        else:
+            for name, is_string in ONNX_INPUTS:
+                if is_string:
+                    col = np.array([["" if row.get(name) is None else str(row.get(name))] for row in items], dtype=object)
+                else:
+                    col = np.empty((n, 1), dtype=np.float32)
+                    col[:, 0] = [_to_float_or_nan(row.get(name)) for row in items]
+                feeds[name] = col
+        probs = ONNX_SESSION.run([ONNX_PROBA_OUTPUT], feeds)[0]
+        return np.asarray(probs, dtype=float).reshape(n, -1)
+    except Exception as e:
+        print(f"[score.py] ONNX inference failed, using joblib pipeline: {e}")
+        return None
+
+
+def _pipeline_predict_proba(df: pd.DataFrame) -> np.ndarray:
+    """
+    predict_proba through the joblib pipeline. With SCORE_DIRECT_BOOSTER=1 the fitted
+    preprocessing steps transform the frame and the XGBoost Booster scores a DMatrix
+    directly, skipping the sklearn-xgboost wrapper's validation and dispatch.
+    """
+    if BOOSTER is not None:
+        try:
+            probs = BOOSTER.predict(xgboost.DMatrix(PREPROCESSOR.transform(df)))
+            # binary:logistic yields P(positive) only
+            return np.column_stack([1.0 - probs, probs]) if probs.ndim == 1 else probs
+        except Exception as e:
+            print(f"[score.py] Direct Booster predict failed, using pipeline: {e}")
+    return MODEL.predict_proba(df)
+
+
+def _model_predict_proba(items: List[Dict[str, Any]]) -> np.ndarray:
+    """Probabilities for a list of records: ONNX Runtime if loaded, else the joblib pipeline."""
+    probs = _onnx_predict_proba(items)
+    if probs is None:
+        probs = _pipeline_predict_proba(_build_feature_frame(items))
+    return np.asarray(probs)
+
+
+def _microbatch_worker() -> None:
+    """
+    Drain queued requests for up to MICROBATCH_MS (or MICROBATCH_MAX_ROWS rows), score
+    them in one model call and fan the probability slices back to each request's Future.
+    If the combined call fails, each request is retried alone so one bad payload does
+    not fail its neighbours.
+    """
+    wait_s = MICROBATCH_MS / 1000.0
+    while True:
+        batch = [_BATCH_QUEUE.get()]
+        n_rows = len(batch[0][0])
+        deadline = time.monotonic() + wait_s
+        while n_rows < MICROBATCH_MAX_ROWS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                nxt = _BATCH_QUEUE.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(nxt)
+            n_rows += len(nxt[0])
+
+        try:
+            probs = _model_predict_proba([row for items, _ in batch for row in items])
+        except Exception:
+            for items, fut in batch:
+                try:
+                    fut.set_result(_model_predict_proba(items))
+                except Exception as e:
+                    fut.set_exception(e)
+            continue
+
+        offset = 0
+        for items, fut in batch:
+            fut.set_result(probs[offset:offset + len(items)])
+            offset += len(items)
+
+
+def _start_microbatching() -> None:
+    global _BATCH_QUEUE
+    with _BATCH_LOCK:
+        if _BATCH_QUEUE is not None:
+            return
+        _BATCH_QUEUE = queue.Queue()
+        threading.Thread(target=_microbatch_worker, name="score-microbatch", daemon=True).start()
+    print(f"[score.py] Micro-batching enabled ({MICROBATCH_MS} ms, max {MICROBATCH_MAX_ROWS} rows)")
+
+
+def _submit_microbatch(items: List[Dict[str, Any]]) -> np.ndarray:
+    """Queue records for the micro-batch worker and block until their probabilities are ready."""
+    fut: Future = Future()
+    _BATCH_QUEUE.put((items, fut))
+    return fut.result()
+
+
+def _class_label_maps(model: Any, class_names: Optional[List[str]]) -> Tuple[Optional[Dict[int, str]], Optional[List[str]]]:
+    """
+    Resolve (name_map, keys) for a loaded model: name_map maps encoded class values to
+    CLASS_NAMES, keys are the probability column labels in model.classes_ order.
+    keys is None when the model has no classes_ (decided per request by column count).
+    """
+    classes_attr = getattr(model, "classes_", None)
+    if classes_attr is None:
+        return None, None
+
+    # Prefer model.classes_ with CLASS_NAMES size check
+    name_map = None
+    if class_names and len(class_names) == len(classes_attr):
+        # classes_ may be ints (encoded); map to provided names by index of class value
+        # Build index-by-class-value (if classes_ are [0,1,2])
+        try:
+            order = np.argsort(classes_attr)
+            ordered_classes = np.array(classes_attr)[order]
+            # assume labels [0..n-1] -> CLASS_NAMES by position of ordered_classes
+            name_map = {int(ordered_classes[i]): class_names[i] for i in range(len(class_names))}
+        except Exception:
+            name_map = None
+
+    if name_map:
+        # If model.classes_ aligns with CLASS_NAMES
+        keys = [str(name_map.get(int(c), str(c))) for c in classes_attr]
+    else:
+        # classes_ might already be strings
+        keys = [str(c) for c in classes_attr]
+    return name_map, keys
+
+
 def _label_from_int(yhat: Any, class_names: Optional[List[str]]) -> Any:
     """
     If model returns integers but we know class names, map them.
@@ -312,6 +665,130 @@ def _rule_fallback_row(row: Dict[str, Any]) -> Tuple[str, float, List[str]]:
     return "Low", max(0.6, 1.0 - score), factors
 
 
+# Bit i of a row's factor mask -> RULE_FACTORS[i]; label codes index RULE_LABELS
+RULE_FACTORS = (
+    "Very high temperature", "High temperature", "High vibration",
+    "Very high runtime", "Elevated runtime", "Frequent error logs", "High humidity",
+)
+RULE_LABELS = ("Low", "Medium", "High")
+RULE_FIELDS = ("TemperatureC", "VibrationMM_S", "RuntimeHours", "ErrorLogsCount", "HumidityPercent")
+
+
+def _rules_kernel(temp, vib, hours, errors, hum, score_out, label_out, conf_out, factor_bits):
+    """
+    Same thresholds as _rule_fallback_row over whole columns. Missing values are NaN,
+    which fail every comparison just like None does in the row version.
+    """
+    for i in range(temp.shape[0]):
+        score = 0.0
+        bits = 0
+        if temp[i] >= 45:
+            score += 0.6
+            bits |= 1
+        elif temp[i] >= 38:
+            score += 0.4
+            bits |= 2
+        if vib[i] >= 0.1:
+            score += 0.25
+            bits |= 4
+        if hours[i] >= 3000:
+            score += 0.2
+            bits |= 8
+        elif hours[i] >= 1500:
+            score += 0.1
+            bits |= 16
+        if errors[i] >= 5:
+            score += 0.25
+            bits |= 32
+        if hum[i] >= 70:
+            score += 0.1
+            bits |= 64
+
+        score_out[i] = score
+        factor_bits[i] = bits
+        if score >= 0.7:
+            label_out[i] = 2
+            conf_out[i] = min(0.9, 0.5 + score * 0.5)
+        elif score >= 0.4:
+            label_out[i] = 1
+            conf_out[i] = min(0.8, 0.5 + score * 0.4)
+        else:
+            label_out[i] = 0
+            conf_out[i] = max(0.6, 1.0 - score)
+
+
+if njit is not None:
+    _rules_kernel = njit(cache=True)(_rules_kernel)
+
+
+def _rules_vectorized(temp, vib, hours, errors, hum) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    NumPy version of _rules_kernel: boolean masks per threshold, one C-level pass each.
+    Returns (label codes, confidences, factor bitmasks).
+    """
+    with np.errstate(invalid="ignore"):
+        very_hot = temp >= 45
+        hot = ~very_hot & (temp >= 38)
+        vibrating = vib >= 0.1
+        very_long = hours >= 3000
+        long_run = ~very_long & (hours >= 1500)
+        erroring = errors >= 5
+        humid = hum >= 70
+
+    # Accumulate in the same order as the row rules so scores match bit-for-bit
+    score = np.zeros(temp.shape[0])
+    score += np.where(very_hot, 0.6, np.where(hot, 0.4, 0.0))
+    score += np.where(vibrating, 0.25, 0.0)
+    score += np.where(very_long, 0.2, np.where(long_run, 0.1, 0.0))
+    score += np.where(erroring, 0.25, 0.0)
+    score += np.where(humid, 0.1, 0.0)
+
+    high = score >= 0.7
+    medium = ~high & (score >= 0.4)
+    labels = np.select([high, medium], [2, 1], 0)
+    confs = np.select(
+        [high, medium],
+        [np.minimum(0.9, 0.5 + score * 0.5), np.minimum(0.8, 0.5 + score * 0.4)],
+        np.maximum(0.6, 1.0 - score),
+    )
+    bits = (
+        very_hot.astype(np.int64) | hot << 1 | vibrating << 2 | very_long << 3
+        | long_run << 4 | erroring << 5 | humid << 6
+    )
+    return labels, confs, bits
+
+
+def _rule_fallback_batch(items: List[Dict[str, Any]]) -> List[Tuple[str, float, List[str]]]:
+    """
+    Rules fallback for a whole batch. The five numeric fields are stacked once, then
+    scored by the numba kernel when available, or by vectorized NumPy otherwise.
+    Returns [(label, confidence, factors), ...] in input order.
+    """
+    n = len(items)
+    cols = np.full((len(RULE_FIELDS), n), np.nan)
+    for i, row in enumerate(items):
+        for j, field in enumerate(RULE_FIELDS):
+            v = _to_float(row.get(field))
+            if v is not None:
+                cols[j, i] = v
+
+    if njit is not None:
+        score = np.empty(n)
+        labels = np.empty(n, dtype=np.int64)
+        confs = np.empty(n)
+        bits = np.empty(n, dtype=np.int64)
+        _rules_kernel(cols[0], cols[1], cols[2], cols[3], cols[4], score, labels, confs, bits)
+    else:
+        labels, confs, bits = _rules_vectorized(cols[0], cols[1], cols[2], cols[3], cols[4])
+
+    out = []
+    for lab, conf, b in zip(labels.tolist(), confs.tolist(), bits.tolist()):
+        # Only rows where a threshold fired need their factor list assembled
+        factors = [name for k, name in enumerate(RULE_FACTORS) if b >> k & 1] if b else []
+        out.append((RULE_LABELS[lab], conf, factors))
+    return out
+
+
 def _to_float(x) -> Optional[float]:
     try:
         if x is None:
@@ -321,30 +798,52 @@ def _to_float(x) -> Optional[float]:
         return None
 
 
-def _build_result_row(
-    row: Dict[str, Any],
-    label: str,
-    confidence: float,
-    prob_map: Dict[str, float],
-    used_model: bool,
-    missing: List[str],
-    extra: List[str],
-) -> Dict[str, Any]:
-    return {
-        "device_name": row.get("DeviceName"),
+def _to_float_or_nan(x) -> float:
+    v = _to_float(x)
+    return np.nan if v is None else v
+
+
+# Compact per-row result kept during scoring; expanded to the response dict only at the end
+PredRow = namedtuple("PredRow", "device_name prediction confidence factors probs used_model")
+
+# Source for the per-row result builder. MODEL_VERSION is folded in as a literal and
+# helpers are bound as default args (local lookups) when init() compiles it.
+_RESULT_BUILDER_SRC = """
+def _build_result_row(r, missing, extra, timestamp, _risk=_risk_score_from_probs, _float=float):
+    device_name, label, confidence, factors, prob_map, used_model = r
+    return {{
+        "device_name": device_name,
         "prediction": label,
-        "confidence": float(confidence) if confidence is not None else None,
-        "risk_score": _risk_score_from_probs(prob_map) if prob_map else (1.0 - confidence if label == "Low" else confidence),
-        "factors": [f for f in row.get("_factors", [])] if row.get("_factors") else [],
-        "model_version": MODEL_VERSION or "unknown",
-        "timestamp": _utcnow_iso(),
-        "debug": {
+        "confidence": _float(confidence) if confidence is not None else None,
+        "risk_score": _risk(prob_map) if prob_map else (1.0 - confidence if label == "Low" else confidence),
+        "factors": list(factors) if factors else [],
+        "model_version": {model_version!r},
+        "timestamp": timestamp,
+        "debug": {{
             "used_model": used_model,
             "probabilities": prob_map,
             "missing_features": missing,
             "extra_features": extra,
-        },
-    }
+        }},
+    }}
+"""
+
+
+def _compile_result_builder(model_version: Optional[str]):
+    """Specialize the result-row builder for the loaded model version."""
+    namespace: Dict[str, Any] = {"_risk_score_from_probs": _risk_score_from_probs}
+    src = _RESULT_BUILDER_SRC.format(model_version=model_version or "unknown")
+    exec(compile(src, "<score.py result builder>", "exec"), namespace)
+    return namespace["_build_result_row"]
+
+
+# Rebuilt by init() once MODEL_VERSION is known
+_build_result_row = _compile_result_builder(None)
+
+
+def _serialize_predictions(rows: List[PredRow], missing: List[str], extra: List[str], timestamp: str) -> List[Dict[str, Any]]:
+    build = _build_result_row
+    return [build(r, missing, extra, timestamp) for r in rows]
 
 
 # ---------- Azure ML hooks ----------
@@ -353,10 +852,21 @@ def init():
     """
     Azure ML init hook: load the model and optional metadata.
     """
-    global MODEL, MODEL_VERSION, CLASS_NAMES, EXPECTED_FEATURES
+    global MODEL, MODEL_VERSION, CLASS_NAMES, EXPECTED_FEATURES, FEATURE_ORDER, FAST_PREDICT, ONNX_SESSION
+    global EXPECTED_SET, NAME_MAP, CLASS_KEYS, BOOSTER, PREPROCESSOR, _build_result_row
 
     base_dir = os.getenv("AZUREML_MODEL_DIR") or os.getcwd()
 
+    # Route supported sklearn estimators through Intel oneDAL kernels. This must run before
+    # joblib.load so unpickled estimator classes resolve to the patched versions.
+    # Set DISABLE_SKLEARNEX=1 to turn it off (e.g. when diagnosing numeric drift).
+    if os.getenv("DISABLE_SKLEARNEX") != "1":
+        try:
+            from sklearnex import patch_sklearn
+            patch_sklearn()
+        except Exception:
+            pass
+
     # Find and load model
     model_path = _find_model_file(base_dir)
     if model_path:
@@ -401,20 +911,66 @@ def init():
     # Expected feature names (best effort, for debug and validation)
     if MODEL is not None:
         EXPECTED_FEATURES = _get_expected_features_from_pipeline(MODEL)
+        EXPECTED_SET = frozenset(EXPECTED_FEATURES or ())
+        NAME_MAP, CLASS_KEYS = _class_label_maps(MODEL, CLASS_NAMES)
+
+        # Split off the final XGBClassifier so its Booster can be called directly
+        BOOSTER = PREPROCESSOR = None
+        if DIRECT_BOOSTER and xgboost is not None and hasattr(MODEL, "steps"):
+            try:
+                from sklearn.pipeline import Pipeline
+
+                final = MODEL.steps[-1][1]
+                if hasattr(final, "get_booster") and len(MODEL.steps) > 1:
+                    BOOSTER = final.get_booster()
+                    PREPROCESSOR = Pipeline(MODEL.steps[:-1])
+            except Exception as e:
+                BOOSTER = PREPROCESSOR = None
+                print(f"[score.py] Direct Booster path disabled: {e}")
+        _DIFF_CACHE.clear()
+        names_in = getattr(MODEL, "feature_names_in_", None)
+        FEATURE_ORDER = [str(c) for c in names_in] if names_in is not None else EXPECTED_FEATURES
+
+        # Compile the pipeline once into a specialized single-row function (optional)
+        try:
+            FAST_PREDICT = _compile_fast_predict(MODEL)
+        except Exception as e:
+            FAST_PREDICT = None
+            print(f"[score.py] Stripje fast path disabled: {e}")
+
+        # Prefer ONNX Runtime when an .onnx export ships next to the pickle
+        ONNX_SESSION = None
+        _load_onnx_session(os.path.splitext(model_path)[0] + ".onnx")
+
+        if MICROBATCH_MS > 0 and hasattr(MODEL, "predict_proba"):
+            _start_microbatching()
+
+    _build_result_row = _compile_result_builder(MODEL_VERSION)
+
+    # Compile the rules kernel now rather than on the first fallback request
+    if njit is not None:
+        try:
+            _rule_fallback_batch([{}])
+        except Exception as e:
+            print(f"[score.py] Rules kernel warm-up failed: {e}")
 
 
 def run(raw_data):
     """
     Azure ML run hook: process a request and return JSON.
     """
+    return _respond(_run(raw_data))
+
+
+def _run(raw_data) -> Dict[str, Any]:
     try:
-        # Handle string health-checks
-        if isinstance(raw_data, str) and raw_data.strip().lower() == "ping":
+        # Handle health-checks (raw or JSON-quoted "ping") before any JSON parsing
+        if isinstance(raw_data, (str, bytes, bytearray)) and _is_ping(raw_data):
             return {"success": True, "model_loaded": MODEL is not None, "model_version": MODEL_VERSION, "predictions": []}
 
         # Parse JSON if we got raw string/bytes
         if isinstance(raw_data, (str, bytes, bytearray)):
-            payload = json.loads(raw_data)
+            payload = _loads(raw_data)
         else:
             payload = raw_data
 
@@ -424,26 +980,17 @@ def run(raw_data):
             # nothing to score (health probe scenario)
             return {"success": True, "model_loaded": MODEL is not None, "model_version": MODEL_VERSION, "predictions": []}
 
-        # Normalize to DataFrame
-        df = pd.DataFrame(items)
-        df = _coerce_features(df)
+        # One timestamp for every row in this response
+        ts = _utcnow_iso()
 
         # Track missing/extra relative to expected feature names (if known)
         missing = []
         extra = []
         if EXPECTED_FEATURES:
-            cols_set = set(df.columns.tolist())
-            exp_set = set(EXPECTED_FEATURES)
-            missing = sorted(list(exp_set - cols_set))
-            extra = sorted(list(cols_set - exp_set))
+            missing, extra = _schema_diff(items)
 
-            # Create placeholders for missing features (None/NaN); the pipeline's imputers/scalers should handle
-            for m in missing:
-                df[m] = np.nan
-
-            # Keep all columns; ColumnTransformer will select what it needs by name
-
-        predictions_payload = []
+        # Preallocated; every branch fills each slot by index
+        predictions_payload: List[Optional[PredRow]] = [None] * len(items)
 
         # Decide whether to use model or fallback per-row
         use_model = MODEL is not None
@@ -453,27 +1000,45 @@ def run(raw_data):
             try:
                 # Predict probabilities when available
                 prob_array = None
-                classes_attr = getattr(MODEL, "classes_", None)
-
-                # Pipeline may expose predict_proba at top-level
-                if hasattr(MODEL, "predict_proba"):
-                    prob_array = MODEL.predict_proba(df)  # shape (n, k)
-                # Fallback to predict only
-                y_pred = MODEL.predict(df)
-
-                # Map labels
-                # Prefer model.classes_ with CLASS_NAMES size check
-                name_map = None
-                if classes_attr is not None and CLASS_NAMES and len(CLASS_NAMES) == len(classes_attr):
-                    # classes_ may be ints (encoded); map to provided names by index of class value
-                    # Build index-by-class-value (if classes_ are [0,1,2])
-                    try:
-                        order = np.argsort(classes_attr)
-                        ordered_classes = np.array(classes_attr)[order]
-                        # assume labels [0..n-1] -> CLASS_NAMES by position of ordered_classes
-                        name_map = {int(ordered_classes[i]): CLASS_NAMES[i] for i in range(len(CLASS_NAMES))}
-                    except Exception:
-                        name_map = None
+                y_pred = None
+
+                if _BATCH_QUEUE is not None:
+                    # Coalesce with concurrent requests into a single model call
+                    prob_array = _submit_microbatch(items)
+                else:
+                    # ONNX Runtime first, then the compiled single-record pipeline (no DataFrame round-trip)
+                    prob_array = _onnx_predict_proba(items)
+                    if prob_array is None and len(items) == 1:
+                        prob_array = _fast_predict_proba(items[0])
+
+                if prob_array is None:
+                    # Normalize to DataFrame; ColumnTransformer selects what it needs by name
+                    df = _build_feature_frame(items)
+
+                    # Pipeline may expose predict_proba at top-level
+                    if hasattr(MODEL, "predict_proba"):
+                        prob_array = _pipeline_predict_proba(df)  # shape (n, k)
+                    # Fallback to predict only
+                    y_pred = MODEL.predict(df)
+
+                # Map labels (class keys are resolved once in init())
+                name_map = NAME_MAP
+
+                if prob_array is not None:
+                    # Determine class labels to pair probabilities with
+                    if CLASS_KEYS is not None:
+                        keys = CLASS_KEYS
+                    else:
+                        # fallback to default names of correct length
+                        n_cls = prob_array.shape[1]
+                        keys = CLASS_NAMES if len(CLASS_NAMES) == n_cls else [f"class_{j}" for j in range(n_cls)]
+                        keys = [str(k) for k in keys]
+
+                    # Vectorized argmax / confidence over the whole batch
+                    best_idx = np.argmax(prob_array, axis=1)
+                    best_conf = prob_array[np.arange(prob_array.shape[0]), best_idx].tolist()
+                    best_labels = [keys[j] for j in best_idx.tolist()]
+                    prob_rows = prob_array.tolist()
 
                 for i, row in enumerate(items):
                     # Compute probabilities map
@@ -482,25 +1047,9 @@ def run(raw_data):
                     label_out = None
 
                     if prob_array is not None:
-                        row_probs = prob_array[i]
-                        # Determine class labels to pair probabilities with
-                        if classes_attr is not None:
-                            # If model.classes_ aligns with CLASS_NAMES
-                            if name_map:
-                                keys = [name_map.get(int(c), str(c)) for c in classes_attr]
-                            else:
-                                # classes_ might already be strings
-                                keys = [str(c) for c in classes_attr]
-                        else:
-                            # fallback to default names of correct length
-                            keys = CLASS_NAMES if len(CLASS_NAMES) == len(row_probs) else [f"class_{j}" for j in range(len(row_probs))]
-
-                        prob_map = {str(keys[j]): float(row_probs[j]) for j in range(len(keys))}
-                        # pick argmax
-                        best_idx = int(np.argmax(row_probs))
-                        best_key = list(prob_map.keys())[best_idx]
-                        label_out = best_key
-                        conf = float(row_probs[best_idx])
+                        prob_map = dict(zip(keys, prob_rows[i]))
+                        label_out = best_labels[i]
+                        conf = best_conf[i]
                     else:
                         # No proba -> use predicted label
                         yhat = y_pred[i]
@@ -514,81 +1063,52 @@ def run(raw_data):
                                 label_out = str(yhat)
                         conf = 0.75 if label_out == "Low" else 0.7 if label_out == "Medium" else 0.8  # heuristic
 
-                    predictions_payload.append(
-                        _build_result_row(
-                            row=row,
-                            label=label_out,
-                            confidence=conf,
-                            prob_map=prob_map,
-                            used_model=True,
-                            missing=missing,
-                            extra=extra,
-                        )
+                    predictions_payload[i] = PredRow(
+                        row.get("DeviceName"), label_out, conf, row.get("_factors"), prob_map, True
                     )
 
                 return {
                     "success": True,
                     "model_loaded": True,
                     "model_version": MODEL_VERSION,
-                    "predictions": predictions_payload,
+                    "predictions": _serialize_predictions(predictions_payload, missing, extra, ts),
                 }
 
             except Exception as e:
                 # Model available but prediction failed -> fall back per-row
-                trace = traceback.format_exc()
-                fb_rows = []
-                for row in items:
-                    label, conf, factors = _rule_fallback_row(row)
-                    row["_factors"] = factors
-                    fb_rows.append(
-                        _build_result_row(
-                            row=row,
-                            label=label,
-                            confidence=conf,
-                            prob_map={label: conf},
-                            used_model=False,
-                            missing=missing,
-                            extra=extra,
-                        )
-                    )
-                return {
+                fb_rows = predictions_payload
+                for i, (row, (label, conf, factors)) in enumerate(zip(items, _rule_fallback_batch(items))):
+                    fb_rows[i] = PredRow(row.get("DeviceName"), label, conf, factors, {label: conf}, False)
+                resp = {
                     "success": True,
                     "model_loaded": True,
                     "model_version": MODEL_VERSION,
-                    "predictions": fb_rows,
+                    "predictions": _serialize_predictions(fb_rows, missing, extra, ts),
                     "warning": f"Model prediction failed, used rules fallback: {str(e)}",
-                    "trace": trace,
                 }
+                if INCLUDE_TRACE:
+                    resp["trace"] = traceback.format_exc()
+                return resp
 
         # No model loaded -> rules fallback
-        fb_rows = []
-        for row in items:
-            label, conf, factors = _rule_fallback_row(row)
-            row["_factors"] = factors
-            fb_rows.append(
-                _build_result_row(
-                    row=row,
-                    label=label,
-                    confidence=conf,
-                    prob_map={label: conf},
-                    used_model=False,
-                    missing=missing or [],
-                    extra=extra or [],
-                )
-            )
+        fb_rows = predictions_payload
+        for i, (row, (label, conf, factors)) in enumerate(zip(items, _rule_fallback_batch(items))):
+            fb_rows[i] = PredRow(row.get("DeviceName"), label, conf, factors, {label: conf}, False)
         return {
             "success": True,
             "model_loaded": False,
             "model_version": MODEL_VERSION or "rules-fallback",
-            "predictions": fb_rows,
+            "predictions": _serialize_predictions(fb_rows, missing or [], extra or [], ts),
         }
 
     except Exception as e:
-        # Any unexpected error -> structured failure with trace
-        return {
+        # Any unexpected error -> structured failure (trace only when INCLUDE_TRACE=1)
+        resp = {
             "success": False,
             "model_loaded": MODEL is not None,
             "model_version": MODEL_VERSION,
             "error": str(e),
-            "trace": traceback.format_exc(),
         }
+        if INCLUDE_TRACE:
+            resp["trace"] = traceback.format_exc()
+        return resp
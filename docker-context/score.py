@@ -1,5 +1,5 @@
 # score.py
-import os, json, logging, traceback
+import os, json, logging, math, threading, traceback, hashlib, pickle
 from datetime import datetime
 from typing import Any, Dict, List, Tuple
 
@@ -16,6 +16,27 @@ try:
 except Exception:
     xgboost = None
 
+# Optional compiled tree backend (TREELITE_COMPILE=1); tl2cgen is the codegen half of treelite>=4
+try:
+    import treelite
+except Exception:
+    treelite = None
+try:
+    import tl2cgen
+except Exception:
+    tl2cgen = None
+
+# Optional fast JSON: orjson parses requests and pre-serializes responses (numpy-aware)
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    from azureml.contrib.services.aml_response import AMLResponse
+except Exception:
+    AMLResponse = None
+
 logger = logging.getLogger("azureml-inference")
 logging.basicConfig(level=logging.INFO)
 
@@ -25,6 +46,16 @@ MODEL_VERSION = None
 
 # If your LabelEncoder / class order is known, set it via env LABELS_ORDER="High,Low,Medium"
 MODEL_LABELS_GUESS = os.getenv("LABELS_ORDER", "High,Low,Medium").split(",")
+# Label for each predict_proba column, resolved from MODEL.classes_ in init()
+CLASS_LABELS: List[str] = list(MODEL_LABELS_GUESS)
+
+# Pipeline split for direct booster scoring (preprocessor.transform -> Booster.inplace_predict)
+MODEL_PREPROC = None
+MODEL_BOOSTER = None
+MODEL_ITERATION_RANGE: Tuple[int, int] = (0, 0)
+# Native predictor compiled from the booster with treelite; float32 matrix -> probabilities
+MODEL_COMPILED = None
+TREELITE_COMPILE = os.getenv("TREELITE_COMPILE", "0") == "1"
 
 # Defaults and schema used to coerce inbound JSON → DataFrame columns expected by your pipeline
 FEATURE_DEFAULTS: Dict[str, Any] = {
@@ -41,7 +72,7 @@ FEATURE_DEFAULTS: Dict[str, Any] = {
     "Location": "Unknown",
     "OperationalCycles": 1000,
     "UserInteractionsPerDay": 5.0,
-    "LastServiceDate": datetime.utcnow().strftime("%d-%m-%Y"),  # drop before inference
+    "LastServiceDate": "",  # dropped before inference
     "ApproxDeviceAgeYears": 1.0,
     "NumRepairs": 0,
     "ErrorLogsCount": 0,
@@ -54,110 +85,342 @@ NUMERIC_COLS = [
     "ApproxDeviceAgeYears", "NumRepairs", "ErrorLogsCount",
 ]
 CATEGORICAL_COLS = ["DeviceType", "DeviceName", "ClimateControl", "Location"]
+INT_COLS = {"OperationalCycles", "NumRepairs", "ErrorLogsCount"}
+# Numeric model inputs are float32: XGBoost scores in float32 anyway, so this halves
+# the bytes moved through the ColumnTransformer and the booster hand-off
+MODEL_FLOAT_DTYPE = np.float32
+
+# Model input columns in training order (LastServiceDate is dropped before inference)
+FEATURE_COLS = [c for c in FEATURE_DEFAULTS if c != "LastServiceDate"]
+
+# Single-row fast path: a dtype-pinned 1-row frame built in init(), copied once per
+# worker thread and overwritten in place for each request
+_TEMPLATE_DF = None
+_TEMPLATE_POS: Dict[str, int] = {}
+_TLS = threading.local()
+
+# Opt-in (MODEL_SHARED_MEMORY=1): sibling workers unpickle the pipeline from a shared-memory
+# copy instead of re-reading the artifact. Saves load time only; each worker still holds its own model.
+MODEL_SHARED_MEMORY = os.getenv("MODEL_SHARED_MEMORY", "0") == "1"
+_SHM_DIR = "/dev/shm"
+_SHM_PREFIX = "mdfp_"
 
 # ----------------- Utilities -----------------
 def _find_model_path() -> str:
-    """Locate a .pkl model artifact in AZUREML_MODEL_DIR or local working dir."""
-    candidates: List[str] = []
+    """
+    Locate a .pkl model artifact in AZUREML_MODEL_DIR or local working dir.
+    Stops at the first xgboost_pipeline.pkl; other .pkl files are only a fallback.
+    """
+    first_pkl = ""
     mdl_dir = os.getenv("AZUREML_MODEL_DIR")
     if mdl_dir and os.path.isdir(mdl_dir):
-        for root, _, files in os.walk(mdl_dir):
-            for f in files:
-                if f.lower().endswith(".pkl"):
-                    candidates.append(os.path.join(root, f))
-    for name in ["xgboost_pipeline.pkl", "model.pkl", "pipeline.pkl"]:
-        if os.path.exists(name):
-            candidates.append(os.path.abspath(name))
-    # Prefer the known name if present
-    for p in candidates:
-        if os.path.basename(p).lower() == "xgboost_pipeline.pkl":
-            return p
-    return candidates[0] if candidates else ""
-
-def _json_safe(x: Any) -> Any:
-    if isinstance(x, np.generic):
-        return x.item()
-    if isinstance(x, np.ndarray):
-        return [_json_safe(v) for v in x.tolist()]
-    if isinstance(x, pd.Timestamp):
-        return x.isoformat()
-    return x
-
-def _coerce_record(rec: Dict[str, Any]) -> Dict[str, Any]:
-    """Fill missing fields, cast types; parse LastServiceDate but drop later."""
-    clean: Dict[str, Any] = {}
-    for k, default in FEATURE_DEFAULTS.items():
-        v = rec.get(k, default)
-        if v is None:
-            v = default
-        if k in {"OperationalCycles", "NumRepairs", "ErrorLogsCount"}:
+        stack = [mdl_dir]
+        while stack:
             try:
-                clean[k] = int(v)
-            except Exception:
-                clean[k] = int(default)
-        elif k in NUMERIC_COLS:
-            try:
-                clean[k] = float(v)
-            except Exception:
-                clean[k] = float(default)
-        else:
-            clean[k] = str(v)
+                entries = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    lower = entry.name.lower()
+                    if lower == "xgboost_pipeline.pkl":
+                        return entry.path
+                    if not first_pkl and lower.endswith(".pkl"):
+                        first_pkl = entry.path
+    # Prefer the known name if present
+    if os.path.exists("xgboost_pipeline.pkl"):
+        return os.path.abspath("xgboost_pipeline.pkl")
+    if first_pkl:
+        return first_pkl
+    for name in ["model.pkl", "pipeline.pkl"]:
+        if os.path.exists(name):
+            return os.path.abspath(name)
+    return ""
 
-    # Attempt to parse LastServiceDate for robustness (training dropped it).
+def _loads(raw: Any) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def _respond(result: Dict[str, Any]) -> Any:
+    """
+    With orjson and AMLResponse available, serialize the response here in one pass and
+    hand the server a ready JSON body; otherwise return the dict for the server to encode.
+    """
+    if orjson is None or AMLResponse is None:
+        return result
+    body = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=str)
+    return AMLResponse(body.decode("utf-8"), 200, json_str=True)
+
+def _untrack_shm(shm) -> None:
+    """Stop the resource tracker unlinking the segment when this worker exits."""
     try:
-        _ = datetime.strptime(clean["LastServiceDate"], "%d-%m-%Y")
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
     except Exception:
+        pass
+
+def _own_segment(name: str) -> bool:
+    """Only trust segments this user created with private permissions (SharedMemory uses 0600)."""
+    try:
+        st = os.stat(os.path.join(_SHM_DIR, name))
+    except OSError:
+        return True  # no /dev/shm view; the attach itself decides
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+def _unlink_stale_segments(current: str) -> None:
+    """Remove segments published for earlier model artifacts so each model change does not leak one."""
+    try:
+        names = [n for n in os.listdir(_SHM_DIR) if n.startswith(_SHM_PREFIX) and n != current]
+    except OSError:
+        return
+    for n in names:
+        if not _own_segment(n):
+            continue
         try:
-            _ = pd.to_datetime(clean["LastServiceDate"], errors="coerce")
-        except Exception:
+            os.unlink(os.path.join(_SHM_DIR, n))
+            logger.info(f"Removed stale model segment {n}")
+        except OSError:
             pass
-    return clean
+
+def _load_model_shared(model_path: str):
+    """
+    Load the pipeline once per container: the first worker joblib-loads it and publishes
+    the pickled bytes to a shared-memory segment keyed by path/size/mtime; sibling workers
+    attach to that segment and unpickle from it instead of re-reading the artifact.
+    The 8-byte length header is written last, so a half-written segment reads as a miss.
+    Unpickling runs code, so segments not owned by this user (or group/world accessible)
+    are ignored. Every worker still unpickles a private copy: this saves load time, not RSS.
+    """
+    if not MODEL_SHARED_MEMORY:
+        return joblib_load(model_path)
+    from multiprocessing import shared_memory
+
+    st = os.stat(model_path)
+    key = f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8")
+    name = _SHM_PREFIX + hashlib.sha1(key).hexdigest()[:20]
+
+    try:
+        if not _own_segment(name):
+            raise PermissionError(f"segment {name} is not private to this user")
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack_shm(shm)
+        try:
+            size = int.from_bytes(bytes(shm.buf[:8]), "little")
+            if size:
+                model = pickle.loads(shm.buf[8:8 + size])
+                logger.info(f"Model attached from shared memory segment {name}")
+                return model
+        finally:
+            shm.close()
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Shared-memory model attach failed, loading from disk: {e}")
+
+    model = joblib_load(model_path)
+    _unlink_stale_segments(name)
+    try:
+        payload = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=8 + len(payload))
+        # The segment outlives this worker for its siblings; _unlink_stale_segments reclaims it
+        _untrack_shm(shm)
+        shm.buf[8:8 + len(payload)] = payload
+        shm.buf[:8] = len(payload).to_bytes(8, "little")
+        shm.close()
+    except FileExistsError:
+        pass  # a sibling worker published it first
+    except Exception as e:
+        logger.warning(f"Could not publish model to shared memory: {e}")
+    return model
+
+def _coerce_value(col: str, v: Any) -> Any:
+    """
+    Cast one raw field to its model type, falling back to FEATURE_DEFAULTS. Both the
+    single-row and batch paths go through here, so a payload scores the same either way.
+    """
+    default = FEATURE_DEFAULTS.get(col)
+    if col in NUMERIC_COLS:
+        try:
+            x = float(v)
+        except (TypeError, ValueError, OverflowError):
+            x = math.nan
+        if col in INT_COLS:
+            # Counts are whole numbers: truncate ("3.7" -> 3) and default non-finite values
+            x = float(math.trunc(x)) if math.isfinite(x) else float(default)
+        elif math.isnan(x):
+            x = float(default)
+        return MODEL_FLOAT_DTYPE(x)
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        v = default
+    return v if v is None else str(v)
+
+def _template_dtypes(columns: List[str]) -> Dict[str, Any]:
+    return {c: np.dtype(MODEL_FLOAT_DTYPE) if c in NUMERIC_COLS else np.dtype(object) for c in columns}
+
+def _make_template_df(columns: List[str]) -> pd.DataFrame:
+    """1-row frame of FEATURE_DEFAULTS with the model input dtypes pinned."""
+    df = pd.DataFrame([{c: FEATURE_DEFAULTS.get(c) for c in columns}], columns=columns)
+    return df.astype(_template_dtypes(columns))
+
+def _single_row_frame(rec: Dict[str, Any]) -> pd.DataFrame:
+    """Coerce one raw record straight into this thread's copy of the template."""
+    df = getattr(_TLS, "frame", None)
+    if df is None or getattr(_TLS, "template", None) is not _TEMPLATE_DF:
+        df = _TLS.frame = _TEMPLATE_DF.copy(deep=True)
+        _TLS.template = _TEMPLATE_DF
+    for col, pos in _TEMPLATE_POS.items():
+        # Numerics come back as float32 scalars; a Python float would make pandas upcast the column
+        df.iat[0, pos] = _coerce_value(col, rec.get(col))
+    return df
+
+def _check_template_dtypes(columns: List[str]) -> None:
+    """Score a defaults row through the fast path once and fail if any column dtype drifted."""
+    df = _single_row_frame({})
+    expected = _template_dtypes(columns)
+    drifted = [f"{c}: {df[c].dtype}" for c in columns if df[c].dtype != expected[c]]
+    if drifted:
+        raise TypeError(f"Single-row template dtypes drifted ({', '.join(drifted)})")
 
 def _build_dataframe(items: List[Dict[str, Any]]) -> pd.DataFrame:
-    rows = [_coerce_record(r) for r in items]
-    df = pd.DataFrame(rows)
-    # Drop training-excluded column
-    if "LastServiceDate" in df.columns:
-        df = df.drop(columns=["LastServiceDate"])
-    # Ensure all expected columns exist (order is not critical for ColumnTransformer by-name)
-    for col in (CATEGORICAL_COLS + NUMERIC_COLS):
-        if col not in df.columns:
-            df[col] = FEATURE_DEFAULTS.get(col, np.nan)
+    """
+    Raw records -> training-schema frame. Single records are written into the
+    dtype-pinned template; batches are built column by column. Both use _coerce_value.
+    """
+    if len(items) == 1 and _TEMPLATE_DF is not None:
+        return _single_row_frame(items[0])
+
+    df = pd.DataFrame(items)
+    # Drop training-excluded column; ensure all expected columns exist in training order
+    df = df.drop(columns=["LastServiceDate"], errors="ignore").reindex(columns=FEATURE_COLS)
+    for col in NUMERIC_COLS:
+        df[col] = np.fromiter(
+            (_coerce_value(col, v) for v in df[col].tolist()), dtype=MODEL_FLOAT_DTYPE, count=len(df)
+        )
+    for col in CATEGORICAL_COLS:
+        df[col] = [_coerce_value(col, v) for v in df[col].tolist()]
     return df
 
-# --------- Human-friendly fallback (mirrors your rules) ---------
-def _fallback_score_one(r: Dict[str, Any]) -> Tuple[str, float, List[str], float]:
+def _resolve_class_labels(model) -> List[str]:
     """
-    Returns (label, risk_score[0..1], factors, confidence[0..1])
+    Label per predict_proba column. String classes_ are used as-is; label-encoded
+    integer classes are mapped through MODEL_LABELS_GUESS.
     """
-    risk = 0.0
-    factors: List[str] = []
+    classes = getattr(model, "classes_", None)
+    if classes is None:
+        return list(MODEL_LABELS_GUESS)
+    labels: List[str] = []
+    for c in classes:
+        if isinstance(c, (np.integer, int)) and 0 <= int(c) < len(MODEL_LABELS_GUESS):
+            labels.append(MODEL_LABELS_GUESS[int(c)])
+        else:
+            labels.append(str(c))
+    return labels
+
+def _split_pipeline(model) -> Tuple[Any, Any, Tuple[int, int]]:
+    """(preprocessor, booster, iteration_range) for a Pipeline ending in an XGB estimator, else Nones."""
+    steps = getattr(model, "steps", None)
+    if not steps or len(steps) < 2:
+        return None, None, (0, 0)
+    final = steps[-1][1]
+    if not hasattr(final, "get_booster"):
+        return None, None, (0, 0)
+    booster = final.get_booster()
+    # Honour early stopping the same way XGBClassifier.predict_proba does
     try:
-        if float(r.get("RuntimeHours", 0)) > 8000:
-            risk += 0.3; factors.append("High runtime hours")
-        if float(r.get("TemperatureC", 0)) > 35:
-            risk += 0.2; factors.append("High temperature")
-        if float(r.get("VibrationMM_S", 0)) > 0.8:
-            risk += 0.2; factors.append("Excessive vibration")
-        if int(float(r.get("ErrorLogsCount", 0))) > 15:
-            risk += 0.2; factors.append("Many error logs")
-        if int(float(r.get("NumRepairs", 0))) > 10:
-            risk += 0.3; factors.append("Frequent repairs")
+        best = final.best_iteration
+        iteration_range = (0, int(best) + 1) if best is not None else (0, 0)
     except Exception:
-        # If any cast fails, just keep whatever we already accumulated
-        pass
+        iteration_range = (0, 0)
+    return model[:-1], booster, iteration_range
 
-    if risk >= 0.7:
-        label = "High"
-    elif risk >= 0.4:
-        label = "Medium"
+def _compile_booster(booster) -> Any:
+    """
+    Compile the booster to a shared library with treelite and return a callable
+    float32 matrix -> raw predictor output. Needs gcc in the image.
+    """
+    if treelite is None:
+        raise RuntimeError("treelite is not installed")
+    if hasattr(treelite, "frontend"):
+        tl_model = treelite.frontend.from_xgboost(booster)
     else:
-        label = "Low"
+        tl_model = treelite.Model.from_xgboost(booster)
+    # One library per worker process so sibling workers don't race on the same file
+    libpath = os.path.join(os.getenv("TREELITE_LIBDIR", "/tmp"), f"model_{os.getpid()}.so")
+    params = {"parallel_comp": 32}
+    if tl2cgen is not None:
+        tl2cgen.export_lib(tl_model, toolchain="gcc", libpath=libpath, params=params)
+        predictor = tl2cgen.Predictor(libpath, nthread=1)
+        return lambda X: predictor.predict(tl2cgen.DMatrix(X))
+    import treelite_runtime  # treelite<4 ships its runtime separately
+    tl_model.export_lib(toolchain="gcc", libpath=libpath, params=params)
+    predictor = treelite_runtime.Predictor(libpath, nthread=1)
+    return lambda X: predictor.predict(treelite_runtime.DMatrix(X))
 
-    conf = 0.75 if label != "Medium" else 0.65
-    if not factors:
-        factors = ["All parameters within typical ranges"]
-    return label, max(0.0, min(1.0, risk)), factors, conf
+def _as_proba_matrix(probs: Any, n_rows: int) -> np.ndarray:
+    """(n_rows, n_classes) view of booster output; binary:logistic only gives P(class 1)."""
+    probs = np.asarray(probs).reshape(n_rows, -1)
+    if probs.shape[1] == 1:
+        probs = np.column_stack([1.0 - probs[:, 0], probs[:, 0]])
+    return probs
+
+def _model_predict_proba(df: pd.DataFrame) -> np.ndarray:
+    """
+    Class probabilities for df. Runs the fitted preprocessor and hands a dense float32
+    matrix to the compiled treelite predictor if one was built, else to
+    Booster.inplace_predict (no per-call DMatrix); other models use predict_proba.
+    """
+    if MODEL_BOOSTER is not None:
+        try:
+            X = MODEL_PREPROC.transform(df)
+            if hasattr(X, "toarray"):
+                X = X.toarray()
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            if MODEL_COMPILED is not None:
+                try:
+                    return _as_proba_matrix(MODEL_COMPILED(X), X.shape[0])
+                except Exception as e:
+                    logger.warning(f"Compiled predictor failed, using booster: {e}")
+            probs = MODEL_BOOSTER.inplace_predict(X, iteration_range=MODEL_ITERATION_RANGE)
+            return _as_proba_matrix(probs, X.shape[0])
+        except Exception as e:
+            logger.warning(f"Direct booster prediction failed, using pipeline predict_proba: {e}")
+    return np.asarray(MODEL.predict_proba(df))
+
+# --------- Human-friendly fallback (mirrors your rules) ---------
+# (column, threshold, risk weight, factor) — a rule fires when value > threshold
+_FALLBACK_RULES: Tuple[Tuple[str, float, float, str], ...] = (
+    ("RuntimeHours", 8000, 0.3, "High runtime hours"),
+    ("TemperatureC", 35, 0.2, "High temperature"),
+    ("VibrationMM_S", 0.8, 0.2, "Excessive vibration"),
+    ("ErrorLogsCount", 15, 0.2, "Many error logs"),
+    ("NumRepairs", 10, 0.3, "Frequent repairs"),
+)
+
+def _fallback_score_batch(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, List[List[str]], np.ndarray]:
+    """
+    Rules over the whole coerced frame at once.
+    Returns (labels, risk_scores[0..1], factors per row, confidences[0..1])
+    """
+    n = len(df)
+    risk = np.zeros(n, dtype=np.float64)
+    masks = np.empty((n, len(_FALLBACK_RULES)), dtype=bool)
+    for j, (col, threshold, weight, _) in enumerate(_FALLBACK_RULES):
+        values = df[col].to_numpy()
+        # Compare in the column's own dtype so e.g. float32(0.8) is not "> 0.8"
+        hit = values > values.dtype.type(threshold)
+        masks[:, j] = hit
+        risk += np.where(hit, weight, 0.0)
+
+    labels = np.where(risk >= 0.7, "High", np.where(risk >= 0.4, "Medium", "Low"))
+    conf = np.where(labels == "Medium", 0.65, 0.75)
+    names = [rule[3] for rule in _FALLBACK_RULES]
+    factors = [
+        [name for name, fired in zip(names, row) if fired] or ["All parameters within typical ranges"]
+        for row in masks.tolist()
+    ]
+    return labels, np.clip(risk, 0.0, 1.0), factors, conf
 
 # ----------------- Azure ML entry points -----------------
 def init():
@@ -165,7 +428,8 @@ def init():
     Called once on container start. Load the model if available; otherwise
     keep None and use human-readable fallback rules.
     """
-    global MODEL, MODEL_VERSION
+    global MODEL, MODEL_VERSION, CLASS_LABELS, _TEMPLATE_DF, _TEMPLATE_POS
+    global MODEL_PREPROC, MODEL_BOOSTER, MODEL_ITERATION_RANGE, MODEL_COMPILED
     try:
         model_path = _find_model_path()
         if not model_path:
@@ -176,39 +440,86 @@ def init():
 
         logger.info(f"Loading model from: {model_path}")
         try:
-            MODEL = joblib_load(model_path)  # sklearn/xgboost pipelines
+            MODEL = _load_model_shared(model_path)  # sklearn/xgboost pipelines
             # If AZUREML_MODEL_DIR has a versioned folder, use that; otherwise use env/model filename
             MODEL_VERSION = os.getenv("MODEL_VERSION", os.path.basename(os.path.dirname(model_path)) or "1")
+            CLASS_LABELS = _resolve_class_labels(MODEL)
             logger.info("Model loaded successfully.")
+
+            try:
+                MODEL_PREPROC, MODEL_BOOSTER, MODEL_ITERATION_RANGE = _split_pipeline(MODEL)
+                if MODEL_BOOSTER is not None:
+                    logger.info("Scoring via preprocessor + Booster.inplace_predict.")
+            except Exception as e:
+                logger.warning(f"Could not unpack pipeline booster, using predict_proba: {e}")
+                MODEL_PREPROC, MODEL_BOOSTER = None, None
+
+            # Compiled trees ignore iteration_range, so only use them on full-depth models
+            MODEL_COMPILED = None
+            if TREELITE_COMPILE and MODEL_BOOSTER is not None and MODEL_ITERATION_RANGE == (0, 0):
+                try:
+                    MODEL_COMPILED = _compile_booster(MODEL_BOOSTER)
+                    logger.info("Scoring via treelite-compiled predictor.")
+                except Exception as e:
+                    logger.warning(f"Treelite compile failed, using Booster.inplace_predict: {e}")
+
+            # Column order must match training (sklearn checks feature names on predict)
+            try:
+                names_in = getattr(MODEL, "feature_names_in_", None)
+                cols = [str(c) for c in names_in] if names_in is not None else FEATURE_COLS
+                _TEMPLATE_DF = _make_template_df(cols)
+                _TEMPLATE_POS = {c: i for i, c in enumerate(cols)}
+                _check_template_dtypes(cols)
+            except Exception as e:
+                logger.warning(f"Single-row template unavailable, using DataFrame path: {e}")
+                _TEMPLATE_DF = None
         except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("Failed to load model: %s", e)
             MODEL = None
             MODEL_VERSION = os.getenv("MODEL_VERSION", "rules-fallback")
     except Exception as e:
-        logger.error(f"init() unexpected error: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("init() unexpected error: %s", e)
         MODEL = None
         MODEL_VERSION = os.getenv("MODEL_VERSION", "rules-fallback")
 
-def _predict_batch(df: pd.DataFrame, raw_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _predict_batch(df: pd.DataFrame) -> List[Dict[str, Any]]:
     results: List[Dict[str, Any]] = []
     used_model = MODEL is not None
     labels_guess = MODEL_LABELS_GUESS
+    class_labels = CLASS_LABELS
+    probs = preds = None
 
     if used_model:
         try:
-            probs = MODEL.predict_proba(df) if hasattr(MODEL, "predict_proba") else None
-            preds = MODEL.predict(df)
+            # One pipeline pass: labels come from the argmax of the probabilities;
+            # predict() is only needed for models without predict_proba
+            if hasattr(MODEL, "predict_proba"):
+                probs = _model_predict_proba(df)
+            else:
+                preds = MODEL.predict(df)
         except Exception as e:
             # Typical failure: env mismatch, missing xgboost, or feature mismatch.
-            logger.error(f"Model prediction failed, switching to fallback: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("Model prediction failed, switching to fallback: %s", e)
             used_model = False
 
-    for i, rec in enumerate(raw_items):
-        device_name = rec.get("DeviceName") or rec.get("device_name") or "Unknown"
-        fb_label, fb_risk, fb_factors, fb_conf = _fallback_score_one(rec)
+    fb_labels, fb_risks, fb_factors_all, fb_confs = _fallback_score_batch(df)
+
+    # Whole-batch model outputs, computed once and indexed per row below
+    if used_model and probs is not None:
+        n = min(probs.shape[1], len(class_labels))
+        prob_labels = class_labels[:n]
+        prob_rows = probs[:, :n].tolist()
+        model_confs = probs.max(axis=1).tolist()
+        model_labels = [class_labels[j] for j in probs[:, :n].argmax(axis=1).tolist()]
+    n_guess = len(labels_guess)
+    model_version = MODEL_VERSION or "unknown"
+    used_model_flag = bool(MODEL is not None)
+    timestamp = datetime.utcnow().isoformat() + "Z"
+
+    for i, (device_name, fb_label, fb_risk, fb_factors, fb_conf) in enumerate(
+        zip(df["DeviceName"].tolist(), fb_labels.tolist(), fb_risks.tolist(), fb_factors_all, fb_confs.tolist())
+    ):
+        device_name = device_name or "Unknown"
 
         pred_label = fb_label
         confidence = fb_conf
@@ -216,17 +527,15 @@ def _predict_batch(df: pd.DataFrame, raw_items: List[Dict[str, Any]]) -> List[Di
 
         if used_model:
             try:
-                if "probs" in locals() and probs is not None:
-                    row = probs[i]
-                    n = min(len(row), len(labels_guess))
-                    probabilities = {labels_guess[j]: float(row[j]) for j in range(n)}
-                    confidence = float(np.max(row))
-                    pred_label_guess = labels_guess[int(np.argmax(row[:n]))]
+                if probs is not None:
+                    probabilities = dict(zip(prob_labels, prob_rows[i]))
+                    confidence = model_confs[i]
+                    pred_label_guess = model_labels[i]
                 else:
                     # Some pipelines return string labels directly; guard for both int/str
                     raw_pred = preds[i]
                     if isinstance(raw_pred, (np.integer, int)):
-                        pred_label_guess = labels_guess[int(raw_pred)] if int(raw_pred) < len(labels_guess) else fb_label
+                        pred_label_guess = labels_guess[int(raw_pred)] if int(raw_pred) < n_guess else fb_label
                     else:
                         pred_label_guess = str(raw_pred)
                 # prefer model when reasonably confident
@@ -240,10 +549,10 @@ def _predict_batch(df: pd.DataFrame, raw_items: List[Dict[str, Any]]) -> List[Di
             "confidence": float(confidence),
             "risk_score": float(fb_risk),         # interpretable rules score
             "factors": fb_factors,                # human-friendly reasons
-            "model_version": MODEL_VERSION or "unknown",
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "model_version": model_version,
+            "timestamp": timestamp,
             "debug": {
-                "used_model": bool(MODEL is not None),
+                "used_model": used_model_flag,
                 "probabilities": probabilities
             }
         })
@@ -276,27 +585,29 @@ def run(raw_data):
         "model_loaded": bool,
         "model_version": "...",
         "predictions": [ { device_name, prediction, confidence, risk_score, factors[], ... }, ... ],
-        "error"/"trace": "...optional..."
+        "error": "...", "trace": "...only when DEBUG logging is enabled..."
       }
     """
+    return _respond(_run(raw_data))
+
+def _run(raw_data) -> Dict[str, Any]:
     try:
         if isinstance(raw_data, (str, bytes, bytearray)):
-            payload = json.loads(raw_data)
+            payload = _loads(raw_data)
         elif isinstance(raw_data, dict):
             payload = raw_data
         else:
-            payload = json.loads(str(raw_data))
+            payload = _loads(str(raw_data))
 
         items = _extract_items(payload)
         if not items:
             raise ValueError("No records provided.")
 
-        # Normalize to training schema and build DF
-        cleaned = [_coerce_record(r) for r in items]
-        df = _build_dataframe(cleaned)
+        # Normalize to training schema and build DF (single coercion pass)
+        df = _build_dataframe(items)
 
-        # Predict (or fallback)
-        preds = _predict_batch(df, cleaned)
+        # Predict (or fallback); rules read the coerced values
+        preds = _predict_batch(df)
 
         return {
             "success": True,
@@ -305,10 +616,9 @@ def run(raw_data):
             "predictions": preds
         }
     except Exception as e:
-        logger.error(f"run() error: {e}")
-        logger.error(traceback.format_exc())
-        return {
-            "success": False,
-            "error": str(e),
-            "trace": traceback.format_exc()
-        }
+        logger.exception("run() error: %s", e)
+        result = {"success": False, "error": str(e)}
+        # Only stringify the traceback for callers when debugging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            result["trace"] = traceback.format_exc()
+        return result
@@ -136,4 +136,34 @@ print(f"✅ XGBoost - Accuracy: {accuracy:.4f}, F1 Score: {f1:.4f}")
 print(classification_report(y_test, y_pred, target_names=encoder.classes_))
 
 
-joblib.dump(pipeline, "xgboost_pipeline.pkl")
+# Keep the dump uncompressed: LocalModel loads it with mmap_mode="r" so array leaves are shared
+joblib.dump(pipeline, "xgboost_pipeline.pkl", compress=0)
+
+
+# Optional: export an ONNX copy for onnxruntime serving (needs skl2onnx + onnxmltools).
+# One [None, 1] input per column so the string categoricals keep their own tensor type.
+try:
+    from skl2onnx import convert_sklearn, update_registered_converter
+    from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+    from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+
+    update_registered_converter(
+        XGBClassifier, "XGBoostXGBClassifier",
+        calculate_linear_classifier_output_shapes, convert_xgboost,
+        options={"nocl": [True, False], "zipmap": [True, False, "columns"]},
+    )
+    initial_types = [
+        (col, StringTensorType([None, 1]) if col in categorical_features else FloatTensorType([None, 1]))
+        for col in X.columns
+    ]
+    onx = convert_sklearn(
+        pipeline, "xgboost_pipeline", initial_types,
+        target_opset={"": 12, "ai.onnx.ml": 2},
+        options={id(pipeline.named_steps["model"]): {"zipmap": False}},
+    )
+    with open("xgboost_pipeline.onnx", "wb") as f:
+        f.write(onx.SerializeToString())
+    print("✅ Exported xgboost_pipeline.onnx")
+except Exception as e:
+    print(f"⚠️ ONNX export skipped: {e}")
@@ -2,11 +2,73 @@
 import os
 import logging
 import re
-from typing import List
+import threading
+from typing import Callable, List, Optional
+
+from .presenter import refresh_log_mode
+
+# Optional DFA engines for LOG_DROP_PATTERNS; the stdlib regex is the fallback
+try:
+    import hyperscan
+except Exception:
+    hyperscan = None
+try:
+    import re2
+except Exception:
+    re2 = None
 
 DEFAULT_FMT_DEBUG = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 DEFAULT_FMT_PRESENT = "%(message)s"
 
+def _hyperscan_matcher(patterns: List[str]) -> Callable[[str], bool]:
+    """One Hyperscan block-mode database for all patterns; stops at the first hit."""
+    db = hyperscan.Database()
+    db.compile(
+        expressions=[p.encode("utf-8") for p in patterns],
+        ids=list(range(len(patterns))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns),
+    )
+    lock = threading.Lock()  # the database's scratch space is not shareable across threads
+
+    def _on_match(_id, _start, _end, _flags, hits):
+        hits.append(_id)
+        return True  # halt the scan
+
+    def _search(msg: str) -> bool:
+        hits: List[int] = []
+        with lock:
+            db.scan(msg.encode("utf-8", "replace"), match_event_handler=_on_match, context=hits)
+        return bool(hits)
+
+    return _search
+
+def _build_matcher(patterns: List[str]) -> Optional[Callable[[str], bool]]:
+    """
+    Compile all drop patterns into a single matcher: Hyperscan if installed, then RE2,
+    then one stdlib alternation. Patterns the combined forms can't take (e.g. inline
+    flags mid-pattern) fall back to searching each compiled regex in turn.
+    """
+    if not patterns:
+        return None
+    compiled = [re.compile(p, re.IGNORECASE) for p in patterns]  # validate like before
+    alternation = "|".join(f"(?:{p})" for p in patterns)
+    if hyperscan is not None:
+        try:
+            return _hyperscan_matcher(patterns)
+        except Exception:
+            pass
+    if re2 is not None:
+        try:
+            rx2 = re2.compile("(?i)" + alternation)
+            return lambda msg: rx2.search(msg) is not None
+        except Exception:
+            pass
+    try:
+        rx = re.compile(alternation, re.IGNORECASE)
+        return lambda msg: rx.search(msg) is not None
+    except re.error:
+        return lambda msg: any(r.search(msg) for r in compiled)
+
 class MessageDropFilter(logging.Filter):
     """
     Drops log records whose message matches any of the configured regex patterns.
@@ -14,14 +76,13 @@ class MessageDropFilter(logging.Filter):
     """
     def __init__(self, patterns: List[str]):
         super().__init__()
-        self._compiled = [re.compile(p, re.IGNORECASE) for p in patterns if p.strip()]
+        self._match = _build_matcher([p for p in patterns if p.strip()])
+        self._empty = self._match is None
 
     def filter(self, record: logging.LogRecord) -> bool:
-        msg = str(record.getMessage())
-        for rx in self._compiled:
-            if rx.search(msg):
-                return False
-        return True
+        if self._empty:
+            return True  # nothing configured: don't format the message at all
+        return not self._match(record.getMessage())
 
 def _parse_drop_patterns() -> List[str]:
     raw = os.getenv("LOG_DROP_PATTERNS", "")
@@ -39,6 +100,7 @@ def setup_logging() -> str:
     """
     log_mode = (os.getenv("LOG_MODE", "presentation") or "presentation").strip().lower()
     present_mode = (log_mode == "presentation")
+    refresh_log_mode(log_mode)
 
     root = logging.getLogger()
     if root.handlers:
@@ -4,6 +4,17 @@ import json
 from typing import Dict, Any, Optional, List
 from .reasons import derive_reasons
 
+# LOG_MODE read once; setup_logging() refreshes it after configuring logging
+_LOG_MODE = (os.getenv("LOG_MODE", "presentation") or "presentation").lower()
+
+def refresh_log_mode(log_mode: Optional[str] = None) -> str:
+    """Re-read LOG_MODE (or use the given mode) for calls that don't pass log_mode."""
+    global _LOG_MODE
+    if log_mode is None:
+        log_mode = os.getenv("LOG_MODE", "presentation") or "presentation"
+    _LOG_MODE = log_mode.lower()
+    return _LOG_MODE
+
 def _round_if_float(v: Any, n: int = 2) -> Any:
     try:
         if isinstance(v, float):
@@ -36,7 +47,7 @@ def present_step(message: str, status: Optional[str] = None, log_mode: Optional[
     One-line action update without payloads. Safe for demos.
     """
     if log_mode is None:
-        log_mode = (os.getenv("LOG_MODE", "presentation") or "presentation").lower()
+        log_mode = _LOG_MODE
 
     if log_mode == "presentation":
         if status:
@@ -57,10 +68,11 @@ def present_final(record: Dict[str, Any], log_mode: Optional[str] = None) -> Non
     - debug mode: pretty JSON of the whole record
     """
     if log_mode is None:
-        log_mode = (os.getenv("LOG_MODE", "presentation") or "presentation").lower()
+        log_mode = _LOG_MODE
 
-    final_block = dict(record.get("final") or {})
-    telemetry = dict(record.get("telemetry") or {})
+    # Read-only below, so no defensive copies
+    final_block = record.get("final") or {}
+    telemetry = record.get("telemetry") or {}
 
     # Fill reasons if missing
     factors = _ensure_reasons(final_block, telemetry)
@@ -89,12 +101,7 @@ def present_final(record: Dict[str, Any], log_mode: Optional[str] = None) -> Non
             print(f"Confidence  : {conf}")
         if factors:
             # remove dupes while preserving order
-            seen = set()
-            uniq = []
-            for fac in factors:
-                if fac not in seen:
-                    uniq.append(fac)
-                    seen.add(fac)
+            uniq = list(dict.fromkeys(factors))
             if label == "Low" and uniq == ["Optimal"]:
                 print("Reasons     : Optimal")
             else:
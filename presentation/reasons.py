@@ -5,49 +5,38 @@ def _bool(v: Any) -> bool:
     s = str(v).strip().lower()
     return s in ("1", "true", "yes", "y")
 
+def _to_float(v: Any) -> float:
+    # Numbers skip the try/except; strings and other values still go through float()
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(v)
+    except Exception:
+        return 0.0
+
+# (factor, telemetry key, threshold): aligned with your RuleBasedAssessor thresholds,
+# plus a gentle humidity extra (safe, human-friendly)
+THRESHOLDS = (
+    ("High temperature", "TemperatureC", 38.0),
+    ("High vibration", "VibrationMM_S", 0.05),
+    ("Frequent error logs", "ErrorLogsCount", 3),
+    ("Extended runtime", "RuntimeHours", 2000),
+    ("High humidity", "HumidityPercent", 70),
+)
+
 def derive_reasons(telemetry: Dict[str, Any]) -> List[str]:
     """
     Derive human-friendly factors from raw telemetry.
     Keep this aligned with your simple rules so explanations feel consistent.
     """
     f: List[str] = []
+    get = telemetry.get
+    for name, key, thr in THRESHOLDS:
+        if _to_float(get(key, 0)) >= thr:
+            f.append(name)
 
-    try:
-        temp = float(telemetry.get("TemperatureC", 0))
-    except Exception:
-        temp = 0.0
-    try:
-        vib = float(telemetry.get("VibrationMM_S", 0))
-    except Exception:
-        vib = 0.0
-    try:
-        err = float(telemetry.get("ErrorLogsCount", 0))
-    except Exception:
-        err = 0.0
-    try:
-        hrs = float(telemetry.get("RuntimeHours", 0))
-    except Exception:
-        hrs = 0.0
-    try:
-        hum = float(telemetry.get("HumidityPercent", 0))
-    except Exception:
-        hum = 0.0
     climate = telemetry.get("ClimateControl", "")
-
-    # Align with your RuleBasedAssessor thresholds
-    if temp >= 38.0:
-        f.append("High temperature")
-    if vib >= 0.05:
-        f.append("High vibration")
-    if err >= 3:
-        f.append("Frequent error logs")
-    if hrs >= 2000:
-        f.append("Extended runtime")
-
-    # A couple of gentle extras (safe, human-friendly)
-    if hum >= 70:
-        f.append("High humidity")
-    if _bool(climate) is False and str(climate).lower() not in ("yes", "y", "true", "1"):
+    if not _bool(climate):
         # If climate control looks off / not present
         f.append("No climate control")
 
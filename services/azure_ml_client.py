@@ -1,8 +1,10 @@
 import os
 import json
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger("services.azure_ml_client")
 
@@ -30,8 +32,26 @@ class AzureMLClient:
         if not self.endpoint_url:
             raise ValueError("Azure ML endpoint URL is missing. Set AZURE_ML_ENDPOINT_URL in .env")
 
+        # Headers never change per call; one keep-alive session reuses TCP+TLS to the endpoint
+        self._headers = self._make_headers()
+        self._session = self._make_session()
+
         logger.info("AzureMLClient initialized for endpoint: %s", self.endpoint_url)
 
+    @staticmethod
+    def _make_session() -> requests.Session:
+        retry_kwargs = dict(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+        try:
+            # Scoring is idempotent, so gateway errors on POST are safe to retry
+            retry = Retry(allowed_methods=frozenset({"POST"}), **retry_kwargs)
+        except TypeError:  # urllib3 < 1.26
+            retry = Retry(method_whitelist=frozenset({"POST"}), **retry_kwargs)
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
     def _make_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
         if self.api_key:
@@ -49,26 +69,32 @@ class AzureMLClient:
             ok, raw, label, confidence, model_version
           }
         """
-        payload = {"data": [telemetry_row]}
-        headers = self._make_headers()
+        return self.predict_batch([telemetry_row])[0]
+
+    def predict_batch(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Score several telemetry rows in one REST call ({"data": rows}).
+        Returns one {ok, raw, label, confidence, model_version} dict per row, in order;
+        'raw' is the full endpoint response shared by every row.
+        """
+        if not rows:
+            return []
+        payload = {"data": rows}
 
         try:
-            resp = requests.post(self.endpoint_url, headers=headers, json=payload, timeout=self.timeout_sec)
+            resp = self._session.post(self.endpoint_url, headers=self._headers, json=payload, timeout=self.timeout_sec)
             resp.raise_for_status()
             raw = resp.json()
 
             # Handle score.py "success": False cases (HTTP 200 with an error in body)
             if isinstance(raw, dict) and raw.get("success") is False:
-                return {"ok": False, "error": raw.get("error"), "raw": raw,
-                        "label": None, "confidence": None, "model_version": raw.get("model_version")}
+                err = {"ok": False, "error": raw.get("error"), "raw": raw,
+                       "label": None, "confidence": None, "model_version": raw.get("model_version")}
+                return [dict(err) for _ in rows]
 
             # Try to parse common shapes
-            label = None
-            conf = None
-            model_ver = None
-
+            preds: List[Any] = []
             if isinstance(raw, dict):
-                preds = None
                 if "predictions" in raw and isinstance(raw["predictions"], list) and raw["predictions"]:
                     preds = raw["predictions"]
                 elif isinstance(raw.get("output"), list) and raw["output"]:
@@ -76,14 +102,20 @@ class AzureMLClient:
                 elif "result" in raw and isinstance(raw["result"], dict):
                     preds = [raw["result"]]
 
-                if preds:
-                    p0 = preds[0]
-                    label = p0.get("prediction") or p0.get("label") or p0.get("class")
-                    conf = p0.get("confidence") or p0.get("score") or p0.get("probability")
-                    model_ver = p0.get("model_version") or raw.get("model_version")
-
-            return {"ok": True, "raw": raw, "label": label, "confidence": conf, "model_version": model_ver}
+            results: List[Dict[str, Any]] = []
+            for i in range(len(rows)):
+                label = None
+                conf = None
+                model_ver = None
+                if i < len(preds) and isinstance(preds[i], dict):
+                    p = preds[i]
+                    label = p.get("prediction") or p.get("label") or p.get("class")
+                    conf = p.get("confidence") or p.get("score") or p.get("probability")
+                    model_ver = p.get("model_version") or raw.get("model_version")
+                results.append({"ok": True, "raw": raw, "label": label, "confidence": conf, "model_version": model_ver})
+            return results
 
         except Exception as e:
             logger.exception("Azure ML prediction failed: %s", e)
-            return {"ok": False, "error": str(e), "raw": None, "label": None, "confidence": None, "model_version": None}
+            return [{"ok": False, "error": str(e), "raw": None, "label": None, "confidence": None, "model_version": None}
+                    for _ in rows]
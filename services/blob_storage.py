@@ -1,14 +1,196 @@
 import os
 import json
+import heapq
+import functools
 import logging
-from datetime import datetime, UTC
-from typing import Any, Dict, List, Optional
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from azure.storage.blob import BlobServiceClient, ContentSettings
 from azure.core.exceptions import ResourceExistsError
 
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from azure.core.pipeline.transport import RequestsTransport
+except ImportError:
+    RequestsTransport = None
+
 logger = logging.getLogger("services.blob_storage")
 
+# Keep-alive pool size for blob GET/PUTs; sized for concurrent downloads from the API
+BLOB_POOL_MAXSIZE = max(1, int(os.getenv("BLOB_POOL_MAXSIZE", "32")))
+
+# JSON <-> UTF-8 bytes for uploads/downloads; orjson when installed (numpy-aware, no extra encode pass)
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=str)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+# ISO-8601 parsing for records that predate "ts_epoch"; ciso8601 is a C parser when installed
+try:
+    from ciso8601 import parse_datetime as _parse_iso
+except ImportError:
+    def _parse_iso(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def record_epoch(record: Dict[str, Any]) -> Optional[float]:
+    """UTC epoch seconds of a prediction record ("ts_epoch", else parsed "timestamp"); None if unknown."""
+    ts = record.get("ts_epoch")
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    try:
+        dt = _parse_iso(record.get("timestamp") or "")
+    except (ValueError, TypeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+# Prediction blobs are laid out so listings can filter on name alone:
+#   prediction/YYYY/MM/DD/HH/<device>__<risk>__<YYYYmmdd_HHMMSS>_<id>.json
+# Legacy flat blobs ("prediction_<ts>.json") still match the "prediction" root prefix.
+PREDICTION_ROOT = "prediction"
+LEGACY_PREFIX = "prediction_"  # prediction_<YYYYmmdd_HHMMSS>.json
+_NAME_SEP = "__"
+
+
+def _name_part(value: Any, default: str) -> str:
+    return (str(value) if value else default).replace("/", "-").replace(_NAME_SEP, "_")
+
+
+def prediction_blob_name(device_name: Any, risk: Any, when: Optional[float] = None) -> str:
+    """Blob name for one prediction record, partitioned by UTC hour."""
+    t = time.gmtime(time.time() if when is None else when)
+    return "%s/%s/%s%s%s%s%s_%s.json" % (
+        PREDICTION_ROOT,
+        time.strftime("%Y/%m/%d/%H", t),
+        _name_part(device_name, "Unknown"), _NAME_SEP,
+        _name_part(risk, "Unknown"), _NAME_SEP,
+        time.strftime("%Y%m%d_%H%M%S", t),
+        uuid.uuid4().hex[:8],
+    )
+
+
+def prediction_batch_name(when: Optional[float] = None) -> str:
+    """Blob name for an NDJSON batch of prediction records, partitioned by the flush hour."""
+    t = time.gmtime(time.time() if when is None else when)
+    return "%s/%s/batch_%s_%s.ndjson" % (
+        PREDICTION_ROOT,
+        time.strftime("%Y/%m/%d/%H", t),
+        time.strftime("%Y%m%d_%H%M%S", t),
+        uuid.uuid4().hex[:8],
+    )
+
+
+def parse_prediction_name(blob_name: str) -> Optional[Tuple[str, str]]:
+    """(device_name, risk) encoded in a partitioned prediction blob name, or None for legacy names."""
+    base = blob_name.rsplit("/", 1)[-1]
+    parts = base.split(_NAME_SEP)
+    if len(parts) != 3:
+        return None
+    return parts[0], parts[1]
+
+
+def _legacy_name_time(blob_name: str) -> Optional[datetime]:
+    """UTC time embedded in a flat legacy name, or None if it isn't one."""
+    if not blob_name.startswith(LEGACY_PREFIX):
+        return None
+    try:
+        stamp = blob_name[len(LEGACY_PREFIX):len(LEGACY_PREFIX) + 15]
+        return datetime.strptime(stamp, "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def prediction_name_filter(
+    device: Optional[str] = None,
+    risk: Optional[str] = None,
+    since: Optional[datetime] = None,
+) -> Optional[Callable[[str], bool]]:
+    """
+    Name predicate for list_json_blobs: device substring / exact risk, case-insensitive, and
+    for flat legacy names the embedded upload time against `since` (partitioned names are
+    time-pruned by their prefix instead). Names without the metadata pass; callers still
+    filter the downloaded record.
+    """
+    if not device and not risk and since is None:
+        return None
+    device_lower = device.lower() if device else None
+    risk_lower = risk.lower() if risk else None
+    if since is not None:
+        since = since.astimezone(timezone.utc) if since.tzinfo else since.replace(tzinfo=timezone.utc)
+        since = since.replace(microsecond=0)  # legacy names have second resolution
+
+    def keep(blob_name: str) -> bool:
+        if since is not None:
+            uploaded = _legacy_name_time(blob_name)
+            if uploaded is not None and uploaded < since:
+                return False
+        parsed = parse_prediction_name(blob_name)
+        if parsed is None:
+            return True
+        if device_lower and device_lower not in parsed[0].lower():
+            return False
+        if risk_lower and risk_lower != parsed[1].lower():
+            return False
+        return True
+
+    return keep
+
+
+def prediction_prefixes(since: datetime, now: Optional[datetime] = None) -> List[str]:
+    """
+    Listing prefixes covering [since, now]: one per hour for short windows, one per day otherwise,
+    plus one per day for flat legacy names (prediction_<YYYYmmdd>...), which are pruned to the
+    second by prediction_name_filter(since=...). At most 16 list calls for a 7-day window.
+    """
+    now = now or datetime.now(timezone.utc)
+    since = since.astimezone(timezone.utc) if since.tzinfo else since.replace(tzinfo=timezone.utc)
+    now = now.astimezone(timezone.utc) if now.tzinfo else now.replace(tzinfo=timezone.utc)
+    if now - since <= timedelta(hours=6):
+        step, fmt = timedelta(hours=1), "%Y/%m/%d/%H/"
+        t = since.replace(minute=0, second=0, microsecond=0)
+    else:
+        step, fmt = timedelta(days=1), "%Y/%m/%d/"
+        t = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    prefixes = []
+    while t <= now:
+        prefixes.append(f"{PREDICTION_ROOT}/{t.strftime(fmt)}")
+        t += step
+    d = since.date()
+    while d <= now.date():
+        prefixes.append(f"{LEGACY_PREFIX}{d.strftime('%Y%m%d')}")
+        d += timedelta(days=1)
+    return prefixes
+
+
+@functools.lru_cache(maxsize=8)
+def _service_client(conn: str) -> BlobServiceClient:
+    """
+    One BlobServiceClient per connection string, shared by every BlobStorage instance.
+    Requests go through a single pooled session so TLS connections are reused across calls/threads.
+    """
+    if RequestsTransport is None:
+        return BlobServiceClient.from_connection_string(conn)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=BLOB_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(session=session, session_owner=False, connection_verify=True)
+    return BlobServiceClient.from_connection_string(conn, transport=transport)
+
 
 class BlobStorage:
     """
@@ -23,7 +205,7 @@ class BlobStorage:
         if not conn:
             raise ValueError("AZURE_STORAGE_CONNECTION_STRING not set")
         self.container = os.getenv("AZURE_BLOB_CONTAINER", "medicaldevicestorage")
-        self.client = BlobServiceClient.from_connection_string(conn)
+        self.client = _service_client(conn)
         self.container_client = self.client.get_container_client(self.container)
         try:
             self.container_client.create_container()
@@ -31,10 +213,11 @@ class BlobStorage:
             pass
         logger.info("BlobStorage initialized (container: %s)", self.container)
 
-    def upload_json(self, prefix: str, obj: Dict[str, Any]) -> str:
-        ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
-        name = f"{prefix}_{ts}.json"
-        data = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    def upload_json(self, prefix: str, obj: Dict[str, Any], name: Optional[str] = None) -> str:
+        if name is None:
+            ts = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+            name = f"{prefix}_{ts}.json"
+        data = _dumps(obj)
         self.container_client.upload_blob(
             name,
             data,
@@ -44,20 +227,42 @@ class BlobStorage:
         logger.info("Uploaded JSON to blob: %s", name)
         return name
 
+    def upload_ndjson(self, name: str, records: List[Dict[str, Any]]) -> str:
+        """Upload records as one newline-delimited JSON blob (one PUT for the whole batch)."""
+        data = b"\n".join(_dumps(r) for r in records)
+        self.container_client.upload_blob(
+            name,
+            data,
+            overwrite=False,
+            content_settings=ContentSettings(content_type="application/x-ndjson"),
+        )
+        logger.info("Uploaded %d records to blob: %s", len(records), name)
+        return name
+
     # -----------------------------------------------------------------
     # NEW METHODS (for retrieval)
     # -----------------------------------------------------------------
-    def list_json_blobs(self, prefix: str = "prediction_", limit: int = 100) -> List:
+    def list_json_blobs(
+        self,
+        prefix: Union[str, Iterable[str]] = PREDICTION_ROOT,
+        limit: int = 100,
+        name_filter: Optional[Callable[[str], bool]] = None,
+    ) -> List:
         """
-        List JSON blobs in the container (newest first).
+        List JSON / NDJSON blobs in the container (newest first).
+        `prefix` may be a list of prefixes (e.g. from prediction_prefixes); `name_filter` is applied
+        to blob names during the listing, before anything is downloaded.
+        The listing is streamed through a bounded heap, so only `limit` blobs are kept.
         """
-        blobs = []
+        prefixes = [prefix] if isinstance(prefix, str) else list(prefix)
         try:
-            for blob in self.container_client.list_blobs(name_starts_with=prefix):
-                if blob.name.endswith(".json"):
-                    blobs.append(blob)
-            blobs.sort(key=lambda b: b.last_modified, reverse=True)
-            return blobs[:limit]
+            blobs = (
+                b
+                for p in prefixes
+                for b in self.container_client.list_blobs(name_starts_with=p)
+                if b.name.endswith((".json", ".ndjson")) and (name_filter is None or name_filter(b.name))
+            )
+            return heapq.nlargest(limit, blobs, key=lambda b: b.last_modified)
         except Exception as e:
             logger.error("Error listing blobs: %s", e)
             return []
@@ -70,7 +275,22 @@ class BlobStorage:
         try:
             blob_client = self.container_client.get_blob_client(blob_name)
             data = blob_client.download_blob().readall()
-            return json.loads(data)
+            return _loads(data)
         except Exception as e:
             logger.error("Error downloading %s: %s", blob_name, e)
             return None
+
+    def download_records(self, blob_name: str) -> List[Dict[str, Any]]:
+        """
+        Records stored in a blob, newest first: the object of a .json blob, or every line
+        of an .ndjson batch (written oldest first). Empty list on error.
+        """
+        try:
+            data = self.container_client.get_blob_client(blob_name).download_blob().readall()
+            if blob_name.endswith(".ndjson"):
+                return [_loads(line) for line in reversed(data.splitlines()) if line.strip()]
+            record = _loads(data)
+            return [record] if record else []
+        except Exception as e:
+            logger.error("Error downloading %s: %s", blob_name, e)
+            return []
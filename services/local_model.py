@@ -1,18 +1,68 @@
 import os
 import json
 import joblib
+from joblib import Memory
 import logging
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 import pandas as pd
 
 logger = logging.getLogger("services.local_model")
 
+# Optional JIT for the softmax kernel
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
+def online_softmax(z: np.ndarray) -> np.ndarray:
+    """
+    Softmax with a fused running max + rescaled running sum (online softmax),
+    then one pass writing the output: no max pass and no exp temporary.
+    Expects a non-empty 1-D float64 array of finite values.
+    """
+    m = z[0]
+    d = 1.0
+    for i in range(1, z.shape[0]):
+        x = z[i]
+        if x > m:
+            d = d * np.exp(m - x) + 1.0
+            m = x
+        else:
+            d += np.exp(x - m)
+    y = np.empty_like(z)
+    for i in range(z.shape[0]):
+        y[i] = np.exp(z[i] - m) / d
+    return y
+
+if njit is not None:
+    online_softmax = njit(cache=True, fastmath=True)(online_softmax)
+
+def _default_cache_dir() -> Optional[str]:
+    # Opt-in: only worth it for repetitive inputs (random stream telemetry almost never repeats)
+    raw = (os.getenv("LOCAL_MODEL_CACHE") or "").strip()
+    return raw if raw not in ("", "0") else None
+
+def _parse_bytes(raw: str) -> int:
+    # "64M" / "1G" / "500000" -> bytes
+    raw = raw.strip().upper()
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if raw and raw[-1] in units:
+        return int(float(raw[:-1]) * units[raw[-1]])
+    return int(raw)
+
+def _cached_predict(model: "LocalModel", model_key: str, row_key: Tuple[Any, ...], row: Dict[str, Any]) -> Dict[str, Any]:
+    # joblib.Memory target: hashed on (model_key, row_key) only; the instance and the raw row
+    # are ignored, so rounding shapes the key but a miss scores the real input
+    return model._predict_row(row)
+
 class LocalModel:
     """
     Loads and scores the local xgboost/sklearn pipeline (.pkl).
     Environment:
       - LOCAL_MODEL_PATH (default: xgboost_pipeline.pkl)
+      - LOCAL_MODEL_CACHE (joblib.Memory dir for repeat rows; unset/"" = no cache)
+      - LOCAL_MODEL_CACHE_BYTES (size cap for that dir, trimmed periodically; default 64M)
     Output:
       {
         ok, label, confidence, model_version, probs
@@ -22,87 +72,152 @@ class LocalModel:
     def __init__(self, model_path: Optional[str] = None):
         self.model_path = model_path or os.getenv("LOCAL_MODEL_PATH", "xgboost_pipeline.pkl")
         self._model = None
+        # Set in _ensure_loaded: training column order and a reusable 1-row input buffer.
+        # The buffer makes an instance single-threaded; use one LocalModel per thread.
+        self._feat_names: Tuple[str, ...] = ()
+        self._n_feats = 0
+        self._row_buf: Optional[np.ndarray] = None
+        # Model-fixed class metadata, resolved once in _ensure_loaded
+        self._classes: List[Any] = []
+        self._mapped: Tuple[str, ...] = ()
+        self._label_cache: Dict[Any, str] = {}
+        self._has_proba = False
+        # Repeat telemetry (idle devices, MQTT redeliveries) is answered from a joblib.Memory
+        # cache keyed on the model file + the row rounded to 3 decimals
+        self._model_key = ""
+        cache_dir = _default_cache_dir()
+        self._mem = Memory(cache_dir, verbose=0) if cache_dir else None
+        self._predict_cached = self._mem.cache(_cached_predict, ignore=["model", "row"]) if self._mem else None
+        self._cache_bytes = _parse_bytes(os.getenv("LOCAL_MODEL_CACHE_BYTES", "64M"))
+        self._calls_since_trim = 0
+
+    @staticmethod
+    def _load_model(path: str) -> Any:
+        """
+        Load with mmap_mode="r" so the pipeline's numpy arrays are memory-mapped and
+        shared between worker processes; needs an uncompressed dump (compress=0).
+        """
+        try:
+            return joblib.load(path, mmap_mode="r")
+        except ValueError:
+            return joblib.load(path)
 
     def _ensure_loaded(self):
         if self._model is None:
             if not os.path.exists(self.model_path):
                 raise FileNotFoundError(f"Local model not found at {self.model_path}")
-            self._model = joblib.load(self.model_path)
+            self._model = self._load_model(self.model_path)
+            st = os.stat(self.model_path)
+            self._model_key = f"{os.path.abspath(self.model_path)}:{st.st_size}:{st.st_mtime_ns}"
+            self._feat_names = tuple(str(f) for f in getattr(self._model, "feature_names_in_", ()))
+            self._n_feats = len(self._feat_names)
+            # object dtype: the pipeline takes string categoricals next to the numeric columns
+            self._row_buf = np.empty((1, self._n_feats), dtype=object)
+
+            classes = getattr(self._model, "classes_", None)
+            if classes is None:
+                # Try to peek into final estimator in a pipeline
+                try:
+                    classes = self._model[-1].classes_  # type: ignore[index]
+                except Exception:
+                    classes = None
+            self._classes = list(classes) if classes is not None else []
+            self._mapped = tuple(self._map_label(c) for c in self._classes)
+            self._label_cache = dict(zip(self._classes, self._mapped))
+            self._has_proba = hasattr(self._model, "predict_proba")
             logger.info("Local model loaded from %s", self.model_path)
 
     def _build_frame(self, row: Dict[str, Any]) -> pd.DataFrame:
-        df = pd.DataFrame([row])
-        # If the pipeline has feature_names_in_, align (and let ColumnTransformer handle missing/extras)
-        try:
-            feat_names: List[str] = list(getattr(self._model, "feature_names_in_", []))
-            if feat_names:
-                # align columns; fill missing with NaN
-                for f in feat_names:
-                    if f not in df.columns:
-                        df[f] = np.nan
-                df = df[feat_names]
-        except Exception:
-            pass
-        return df
+        if not self._n_feats:
+            # No recorded feature names: let the model see the row as-is
+            return pd.DataFrame([row])
+        # Fill the preallocated row in training order (missing -> NaN) and wrap it without copying;
+        # the ColumnTransformer selects columns by name, so it still needs a DataFrame
+        buf = self._row_buf
+        get = row.get
+        for i, f in enumerate(self._feat_names):
+            v = get(f)
+            buf[0, i] = v if v is not None else np.nan
+        return pd.DataFrame(buf, columns=self._feat_names, copy=False)
+
+    def _row_key(self, row: Dict[str, Any]) -> Tuple[Any, ...]:
+        """Row in training order; numbers rounded to 3 decimals so near-repeats share a key."""
+        key = []
+        get = row.get
+        for f in self._feat_names:
+            v = get(f)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                v = round(float(v), 3)
+            key.append(v)
+        return tuple(key)
 
     def predict(self, telemetry_row: Dict[str, Any]) -> Dict[str, Any]:
         try:
             self._ensure_loaded()
-            X = self._build_frame(telemetry_row)
-
-            label: Optional[str] = None
-            conf: Optional[float] = None
-            probs_map: Dict[str, float] = {}
-            model_version = os.path.basename(self.model_path)
-
-            classes = None
-            if hasattr(self._model, "classes_"):
-                classes = list(self._model.classes_)
-            else:
-                # Try to peek into final estimator in a pipeline
-                try:
-                    classes = list(self._model[-1].classes_)  # type: ignore[index]
-                except Exception:
-                    pass
+            if self._predict_cached is None or not self._n_feats:
+                # Cache off, or no feature names to key on: score the raw row uncached
+                return self._predict_row(telemetry_row)
+            self._calls_since_trim += 1
+            if self._calls_since_trim >= 256:
+                self._calls_since_trim = 0
+                self._trim_cache()
+            return self._predict_cached(self, self._model_key, self._row_key(telemetry_row), telemetry_row)
+        except Exception as e:
+            logger.exception("Local model prediction failed: %s", e)
+            return {"ok": False, "error": str(e), "label": None, "confidence": None,
+                    "model_version": None, "probs": {}}
 
-            if hasattr(self._model, "predict_proba"):
-                proba = self._model.predict_proba(X)[0]
-            else:
-                # Fallback: try decision_function or just predict (no calibrated confidence)
-                try:
-                    proba = self._softmax(np.atleast_1d(self._model.decision_function(X))[0])
-                except Exception:
-                    pred_only = self._model.predict(X)[0]
+    def _trim_cache(self) -> None:
+        """Evict least-recently-used cache entries beyond LOCAL_MODEL_CACHE_BYTES."""
+        try:
+            self._mem.reduce_size(bytes_limit=self._cache_bytes)
+        except TypeError:  # joblib < 1.4: the limit lives on the Memory instance
+            self._mem.bytes_limit = self._cache_bytes
+            self._mem.reduce_size()
+        except Exception as e:
+            logger.warning("Local model cache trim failed: %s", e)
+
+    def _predict_row(self, telemetry_row: Dict[str, Any]) -> Dict[str, Any]:
+        X = self._build_frame(telemetry_row)
+
+        label: Optional[str] = None
+        model_version = os.path.basename(self.model_path)
+
+        if self._has_proba:
+            proba = self._model.predict_proba(X)[0]
+        else:
+            # Fallback: try decision_function or just predict (no calibrated confidence)
+            try:
+                proba = self._softmax(np.atleast_1d(self._model.decision_function(X))[0])
+            except Exception:
+                pred_only = self._model.predict(X)[0]
+                label = self._label_cache.get(pred_only)
+                if label is None:
                     label = self._map_label(pred_only)
-                    return {"ok": True, "label": label, "confidence": None,
-                            "model_version": model_version, "probs": {}}
-
-            # Map class names
-            if classes is None:
-                classes = list(range(len(proba)))
-
-            # Build probs map
-            for c, p in zip(classes, proba):
-                probs_map[self._map_label(c)] = float(p)
+                return {"ok": True, "label": label, "confidence": None,
+                        "model_version": model_version, "probs": {}}
 
-            # Choose best
-            best_idx = int(np.argmax(proba))
-            label = self._map_label(classes[best_idx])
-            conf = float(proba[best_idx])
+        # Map class names (positional if the model doesn't expose classes_)
+        mapped = self._mapped or tuple(self._map_label(c) for c in range(len(proba)))
+        # One C-level conversion to Python floats, then plain indexing
+        proba_list = proba.tolist()
+        probs_map = dict(zip(mapped, proba_list))
 
-            return {"ok": True, "label": label, "confidence": conf,
-                    "model_version": model_version, "probs": probs_map}
+        # Choose best
+        best_idx = int(proba.argmax())
+        label = mapped[best_idx]
+        conf = proba_list[best_idx]
 
-        except Exception as e:
-            logger.exception("Local model prediction failed: %s", e)
-            return {"ok": False, "error": str(e), "label": None, "confidence": None,
-                    "model_version": None, "probs": {}}
+        return {"ok": True, "label": label, "confidence": conf,
+                "model_version": model_version, "probs": probs_map}
 
     @staticmethod
     def _softmax(z):
-        z = np.array(z, dtype=float)
-        z = z - np.max(z)
-        ez = np.exp(z)
+        z = np.ascontiguousarray(z, dtype=np.float64).ravel()
+        if njit is not None and z.size:
+            return online_softmax(z)
+        # Without numba the loop kernel would be slower than NumPy's three vector passes
+        ez = np.exp(z - np.max(z))
         return ez / np.sum(ez)
 
     @staticmethod
@@ -1,7 +1,8 @@
 import os
 import json
+import queue
+import atexit
 import ssl
-import time
 import logging
 import threading
 from typing import Any, Dict, Optional, Callable
@@ -10,9 +11,24 @@ import paho.mqtt.client as mqtt
 
 logger = logging.getLogger("services.mqtt_service")
 
+# JSON <-> bytes for MQTT payloads; orjson when installed
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, default=str)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data.decode("utf-8", errors="replace"))
+
 class MQTTService:
     """
-    Handles one-shot MQTT publish and one-shot receive.
+    Handles MQTT publish and receive over two long-lived connections (publisher/subscriber).
     Works with HiveMQ Cloud (TLS on 8883).
     """
 
@@ -32,8 +48,25 @@ class MQTTService:
         self.tls = tls
         self.client_id_prefix = client_id_prefix
 
-    def _mk_client(self, suffix: str) -> mqtt.Client:
-        client = mqtt.Client(client_id=f"{self.client_id_prefix}-{suffix}", protocol=mqtt.MQTTv311, transport="tcp")
+        # Publisher: connected once on first use, network loop on a background thread
+        self._pub_client: Optional[mqtt.Client] = None
+        self._pub_lock = threading.Lock()
+        self._pub_connected = threading.Event()
+
+        # Subscriber: one connection, one message queue per subscribed topic
+        self._sub_client: Optional[mqtt.Client] = None
+        self._sub_lock = threading.Lock()
+        self._sub_connected = threading.Event()
+        self._queues: Dict[str, "queue.Queue[Optional[Dict[str, Any]]]"] = {}
+        self._suback: Dict[str, threading.Event] = {}
+        self._pending_mids: Dict[int, str] = {}
+        # Push-style subscriptions: topic -> callback run on the network thread
+        self._handlers: Dict[str, Callable[[Optional[Dict[str, Any]]], None]] = {}
+        atexit.register(self.close)
+
+    def _mk_client(self, suffix: str, clean_session: bool = True) -> mqtt.Client:
+        client = mqtt.Client(client_id=f"{self.client_id_prefix}-{suffix}", clean_session=clean_session,
+                             protocol=mqtt.MQTTv311, transport="tcp")
         # Use latest callback API to avoid deprecation warnings
         client._callback_api_version = mqtt.CallbackAPIVersion.VERSION2  # internal switch used by paho
         if self.username:
@@ -42,92 +75,224 @@ class MQTTService:
             client.tls_set(cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_TLS_CLIENT)
         return client
 
-    def publish_once(self, topic: str, message: Dict[str, Any], qos: int = 1, retain: bool = False, timeout: float = 15.0) -> bool:
-        """Connect -> publish -> disconnect."""
-        payload = json.dumps(message, separators=(",", ":"), default=str)
-        client = self._mk_client("pub")
+    def _ensure_pub_client(self) -> mqtt.Client:
+        """Create, connect and start the shared publisher client (call with _pub_lock held)."""
+        if self._pub_client is not None:
+            return self._pub_client
 
-        pub_ok = threading.Event()
+        client = self._mk_client("pub")
 
         def on_connect(c, u, f, rc, props=None):
             if rc == 0:
                 logger.info("MQTT publisher connected")
-                result = c.publish(topic, payload=payload, qos=qos, retain=retain)
-                result.wait_for_publish(timeout=timeout)
-                if result.is_published():
-                    logger.info("Published to %s: %s", topic, payload)
-                    pub_ok.set()
-                else:
-                    logger.error("Publish timed out")
-                c.disconnect()
+                self._pub_connected.set()
             else:
                 logger.error("Publisher connect failed rc=%s", rc)
-                c.disconnect()
+
+        def on_disconnect(c, u, *args):
+            # loop_start() reconnects on its own; publishes wait for on_connect again
+            self._pub_connected.clear()
+            logger.info("MQTT publisher disconnected")
 
         client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
         client.connect(self.host, self.port, keepalive=30)
-        client.loop_forever(timeout=10.0)
-        return pub_ok.is_set()
+        client.loop_start()
+        self._pub_client = client
+        return client
 
-    def receive_once(
-        self,
-        topic: str,
-        timeout: float = 20.0,
-        on_ready: Optional[Callable[[], None]] = None,
-    ) -> Optional[Dict[str, Any]]:
-        """
-        Connect, subscribe, wait for the FIRST message on the topic, then disconnect.
-        If on_ready is provided, it is called right after SUBACK (ensures subscriber is ready).
-        """
-        msg_event = threading.Event()
-        received_payload: Optional[Dict[str, Any]] = None
-        client = self._mk_client("sub")
+    def publish_once(self, topic: str, message: Dict[str, Any], qos: int = 1, retain: bool = False, timeout: float = 15.0) -> bool:
+        """Publish one message over the shared connection and wait for the broker ack (QoS>0)."""
+        payload = _dumps(message)
+
+        with self._pub_lock:
+            try:
+                client = self._ensure_pub_client()
+            except Exception as e:
+                logger.error("Publisher connect failed: %s", e)
+                return False
+            if not self._pub_connected.wait(timeout):
+                logger.error("Publisher not connected after %.1fs", timeout)
+                return False
+            info = client.publish(topic, payload=payload, qos=qos, retain=retain)
+
+        try:
+            info.wait_for_publish(timeout=timeout)
+        except Exception as e:
+            logger.error("Publish failed: %s", e)
+            return False
+        if info.is_published():
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Published to %s: %s", topic, payload.decode("utf-8", errors="replace"))
+            return True
+        logger.error("Publish timed out")
+        return False
+
+    def close(self) -> None:
+        """Stop both network loops and disconnect."""
+        with self._pub_lock:
+            pub, self._pub_client = self._pub_client, None
+            self._pub_connected.clear()
+        with self._sub_lock:
+            sub, self._sub_client = self._sub_client, None
+            self._sub_connected.clear()
+        for client in (pub, sub):
+            if client is None:
+                continue
+            try:
+                client.disconnect()
+                client.loop_stop()
+            except Exception:
+                pass
+
+    def _subscribe(self, client: mqtt.Client, topic: str) -> None:
+        # Call with _sub_lock held; SUBACK for this mid marks the topic ready
+        _, mid = client.subscribe(topic, qos=1)
+        self._pending_mids[mid] = topic
+
+    def _ensure_sub_client(self) -> mqtt.Client:
+        """Create, connect and start the shared subscriber client (call with _sub_lock held)."""
+        if self._sub_client is not None:
+            return self._sub_client
+
+        # Persistent session under a stable client id: the broker queues QoS 1 messages
+        # for us across reconnects instead of dropping them
+        client = self._mk_client("sub", clean_session=False)
 
         def on_connect(c, u, f, rc, props=None):
             if rc == 0:
                 logger.info("MQTT subscriber connected")
-                c.subscribe(topic, qos=1)
+                self._sub_connected.set()
+                # (Re)subscribe everything we are listening on
+                with self._sub_lock:
+                    for t in set(self._queues) | set(self._handlers):
+                        self._subscribe(c, t)
             else:
                 logger.error("Subscriber connect failed rc=%s", rc)
 
+        def on_disconnect(c, u, *args):
+            self._sub_connected.clear()
+            logger.info("MQTT subscriber disconnected")
+
         def on_subscribe(c, u, mid, granted_qos, props=None):
-            logger.info("Subscribed to %s (qos=%s)", topic, granted_qos)
-            # ←— the only change you asked for: a tiny pause before publishing
-            time.sleep(1.0)
-            if on_ready:
-                try:
-                    on_ready()
-                except Exception as e:
-                    logger.exception("on_ready callback failed: %s", e)
+            with self._sub_lock:
+                t = self._pending_mids.pop(mid, None)
+                ev = self._suback.get(t) if t is not None else None
+            if t is not None:
+                logger.info("Subscribed to %s (qos=%s)", t, granted_qos)
+            if ev is not None:
+                ev.set()
 
         def on_message(c, u, msg):
-            nonlocal received_payload
+            handler = self._handlers.get(msg.topic)
+            q = self._queues.get(msg.topic) if handler is None else None
+            if handler is None and q is None:
+                # Wildcard subscriptions: route to the first matching filter
+                for t in list(self._handlers) + list(self._queues):
+                    if mqtt.topic_matches_sub(t, msg.topic):
+                        handler = self._handlers.get(t)
+                        q = self._queues.get(t)
+                        break
+            if handler is None and q is None:
+                return
             try:
-                payload = msg.payload.decode("utf-8", errors="replace")
-                received_payload = json.loads(payload)
-                logger.info("Received from %s: %s", msg.topic, payload)
+                parsed = _loads(msg.payload)
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Received from %s: %s", msg.topic, msg.payload.decode("utf-8", errors="replace"))
             except Exception as e:
                 logger.exception("Failed to parse message: %s", e)
-                received_payload = None
-            finally:
-                msg_event.set()
-                c.disconnect()
+                parsed = None
+            if handler is not None:
+                try:
+                    handler(parsed)
+                except Exception as e:
+                    logger.exception("Message handler for %s failed: %s", msg.topic, e)
+            else:
+                q.put(parsed)
 
         client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
         client.on_subscribe = on_subscribe
         client.on_message = on_message
-
         client.connect(self.host, self.port, keepalive=30)
-        # run network loop in this thread until we get a message or timeout
-        start = time.time()
-        while not msg_event.is_set():
-            client.loop(timeout=10.0)
-            if time.time() - start > timeout:
-                logger.error("Timed out waiting for MQTT message on %s", topic)
-                try:
-                    client.disconnect()
-                except Exception:
-                    pass
-                break
+        client.loop_start()
+        self._sub_client = client
+        return client
+
+    def is_connected(self) -> bool:
+        """True while the subscriber connection is up (CONNACK received, not yet dropped)."""
+        return self._sub_connected.is_set()
+
+    def subscribe(
+        self,
+        topic: str,
+        handler: Callable[[Optional[Dict[str, Any]]], None],
+        timeout: float = 20.0,
+    ) -> bool:
+        """
+        Call `handler(message)` for every message on the topic, on the MQTT network thread.
+        Handlers must be quick and must not block; hand work off to a queue or event loop.
+        Returns True once the broker acknowledges the subscription (SUBACK); False if the
+        connection could not be opened or no SUBACK arrived within `timeout`. The handler
+        stays registered either way and is resubscribed on every reconnect.
+        """
+        with self._sub_lock:
+            try:
+                client = self._ensure_sub_client()
+            except Exception as e:
+                logger.error("Subscriber connect failed: %s", e)
+                return False
+            first = topic not in self._handlers and topic not in self._queues
+            self._handlers[topic] = handler
+            ready = self._suback.setdefault(topic, threading.Event())
+            if first and self._sub_connected.is_set():
+                self._subscribe(client, topic)
+            # else: on_connect subscribes every registered topic
+
+        if not ready.wait(timeout):
+            logger.error("Timed out waiting for SUBACK on %s", topic)
+            return False
+        return True
+
+    def receive_once(
+        self,
+        topic: str,
+        timeout: float = 20.0,
+        on_ready: Optional[Callable[[], None]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the next message on the topic (waiting up to `timeout`), or None.
+        The first call for a topic subscribes on the shared subscriber connection; messages
+        that arrive between calls are queued, not dropped.
+        If on_ready is provided, it is called once the subscription is acknowledged (SUBACK).
+        """
+        with self._sub_lock:
+            try:
+                client = self._ensure_sub_client()
+            except Exception as e:
+                logger.error("Subscriber connect failed: %s", e)
+                return None
+            q = self._queues.get(topic)
+            if q is None:
+                q = self._queues[topic] = queue.Queue()
+                self._suback[topic] = threading.Event()
+                if self._sub_connected.is_set():
+                    self._subscribe(client, topic)
+                # else: on_connect subscribes every queued topic
+            ready = self._suback[topic]
+
+        if on_ready:
+            if not ready.wait(timeout):
+                logger.error("Timed out waiting for SUBACK on %s", topic)
+                return None
+            # SUBACK means the subscription is live; QoS 1 covers anything published right after
+            try:
+                on_ready()
+            except Exception as e:
+                logger.exception("on_ready callback failed: %s", e)
 
-        return received_payload
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            logger.error("Timed out waiting for MQTT message on %s", topic)
+            return None
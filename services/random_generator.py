@@ -1,11 +1,36 @@
 # services/random_generator.py
-import random, json, time
-from datetime import datetime, timedelta
+import random, json, time, threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
 from faker import Faker
 
 
 fake = Faker()
 
+# Per-thread generators: concurrent load-test threads never share RNG state
+_TLS = threading.local()
+
+def _thread_random():
+    rnd = getattr(_TLS, "random", None)
+    if rnd is None:
+        rnd = _TLS.random = random.Random()
+    return rnd
+
+def _thread_rng():
+    rng = getattr(_TLS, "rng", None)
+    if rng is None:
+        rng = _TLS.rng = np.random.default_rng()
+    return rng
+
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj, default=str).decode("utf-8")
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
 device_mapping = {
     "Alaris GH": "Infusion Pump",
     "Baxter AK 96": "Dialysis Machine",
@@ -33,34 +58,86 @@ device_mapping = {
     "Zoll R Series": "Defibrillator"
 }
 
-ClimateControl_list = ["Yes", "No"]
-Location_list = [
+# Built once: random.choice over (name, type) pairs picks a device in one call
+_DEVICE_ITEMS = tuple(device_mapping.items())
+_DEVICE_NAMES = np.array([name for name, _ in _DEVICE_ITEMS])
+_DEVICE_TYPES = np.array([dtype for _, dtype in _DEVICE_ITEMS])
+
+ClimateControl_list = ("Yes", "No")
+Location_list = tuple(
     f"Hospital {h} - {region} Region"
-    for h in list("ABCDEFGH")
-    for region in ["Central","East","North","South","West"]
-]
+    for h in "ABCDEFGH"
+    for region in ("Central", "East", "North", "South", "West")
+)
+# Array views for generate_records' fancy indexing
+_CLIMATE_ARRAY = np.array(ClimateControl_list)
+_LOCATION_ARRAY = np.array(Location_list)
+_N_CLIMATE = len(ClimateControl_list)
+_N_LOCATIONS = len(Location_list)
 
 def generate_record(device_name, device_type):
+    # Local bindings skip the module-attribute lookup on every field
+    rnd = _thread_random()
+    _u, _ri, _r = rnd.uniform, rnd.randint, rnd.random
     return {
         "DeviceType": device_type,
         "DeviceName": device_name,
-        "RuntimeHours": round(random.uniform(102.32, 9999.85), 2),
-        "TemperatureC": round(random.uniform(16.07, 40), 2),
-        "PressureKPa": round(random.uniform(90, 120), 2),
-        "VibrationMM_S": round(random.uniform(0, 1), 3),
-        "CurrentDrawA": round(random.uniform(0.1, 10.5), 3),
-        "SignalNoiseLevel": round(random.uniform(0, 5), 2),
-        "ClimateControl": random.choice(ClimateControl_list),
-        "HumidityPercent": round(random.uniform(20, 70), 2),
-        "Location": random.choice(Location_list),
-        "OperationalCycles": random.randint(5, 11887),
-        "UserInteractionsPerDay": round(random.uniform(0, 30), 2),
-        "ApproxDeviceAgeYears": round(random.uniform(0.1, 35.89), 2),
-        "NumRepairs": random.randint(0, 19),
-        "ErrorLogsCount": random.randint(0, 22),
-        "SentTimestamp": datetime.utcnow().isoformat()
+        "RuntimeHours": round(_u(102.32, 9999.85), 2),
+        "TemperatureC": round(_u(16.07, 40), 2),
+        "PressureKPa": round(_u(90, 120), 2),
+        "VibrationMM_S": round(_u(0, 1), 3),
+        "CurrentDrawA": round(_u(0.1, 10.5), 3),
+        "SignalNoiseLevel": round(_u(0, 5), 2),
+        "ClimateControl": ClimateControl_list[int(_r() * _N_CLIMATE)],
+        "HumidityPercent": round(_u(20, 70), 2),
+        "Location": Location_list[int(_r() * _N_LOCATIONS)],
+        "OperationalCycles": _ri(5, 11887),
+        "UserInteractionsPerDay": round(_u(0, 30), 2),
+        "ApproxDeviceAgeYears": round(_u(0.1, 35.89), 2),
+        "NumRepairs": _ri(0, 19),
+        "ErrorLogsCount": _ri(0, 22),
+        "SentTimestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds")
     }
 
+def generate_records(n, rng=None):
+    """
+    Generate n telemetry records at once (load tests / bulk data): every field is drawn
+    as a NumPy vector, devices are picked at random, and the batch shares one timestamp.
+    Same fields and ranges as generate_record. Returns a list of dicts.
+    """
+    if rng is None:
+        rng = _thread_rng()
+    u = rng.uniform
+    dev_idx = rng.integers(0, len(_DEVICE_ITEMS), n)
+    columns = (
+        _DEVICE_TYPES[dev_idx],
+        _DEVICE_NAMES[dev_idx],
+        u(102.32, 9999.85, n).round(2),
+        u(16.07, 40, n).round(2),
+        u(90, 120, n).round(2),
+        u(0, 1, n).round(3),
+        u(0.1, 10.5, n).round(3),
+        u(0, 5, n).round(2),
+        _CLIMATE_ARRAY[rng.integers(0, _N_CLIMATE, n)],
+        u(20, 70, n).round(2),
+        _LOCATION_ARRAY[rng.integers(0, _N_LOCATIONS, n)],
+        rng.integers(5, 11888, n),
+        u(0, 30, n).round(2),
+        u(0.1, 35.89, n).round(2),
+        rng.integers(0, 20, n),
+        rng.integers(0, 23, n),
+    )
+    keys = (
+        "DeviceType", "DeviceName", "RuntimeHours", "TemperatureC", "PressureKPa", "VibrationMM_S",
+        "CurrentDrawA", "SignalNoiseLevel", "ClimateControl", "HumidityPercent", "Location",
+        "OperationalCycles", "UserInteractionsPerDay", "ApproxDeviceAgeYears", "NumRepairs", "ErrorLogsCount",
+    )
+    ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+    records = [dict(zip(keys, row)) for row in zip(*(c.tolist() for c in columns))]
+    for rec in records:
+        rec["SentTimestamp"] = ts
+    return records
+
 def generate_random_payload(device_name=None, device_type=None):
     """
     Generate one telemetry payload.
@@ -69,10 +146,8 @@ def generate_random_payload(device_name=None, device_type=None):
     Returns (json_str, dict).
     """
     if device_name is None or device_type is None:
-        device_name = random.choice(list(device_mapping.keys()))
-        device_type = device_mapping[device_name]
+        device_name, device_type = _thread_random().choice(_DEVICE_ITEMS)
 
     record = generate_record(device_name, device_type)
-    record["SentTimestamp"] = datetime.utcnow().isoformat()
 
-    return json.dumps(record, separators=(",", ":"), ensure_ascii=False), record
+    return _dumps(record), record
@@ -1,8 +1,54 @@
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
 
 CONF_DEFAULT = float(os.getenv("AML_CONF_THRESHOLD", "0.6"))
 
+# Rule table: a rule fires when value >= threshold and adds its weight to the score
+_RULE_KEYS = ("TemperatureC", "VibrationMM_S", "ErrorLogsCount", "RuntimeHours")
+_THRESH = np.array([38.0, 0.05, 3.0, 2000.0])
+_WEIGHTS = np.array([0.4, 0.3, 0.4, 0.2])
+_FACTORS = ("High temperature", "High vibration", "Frequent error logs", "Long runtime")
+_LABELS = ("Low", "Medium", "High")
+# Plain-float copies for the scalar kernel (numba freezes global tuples as constants)
+_THRESH_T = tuple(_THRESH.tolist())
+_WEIGHTS_T = tuple(_WEIGHTS.tolist())
+
+# Optional JIT for the per-row rules kernel
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
+def _rules_kernel(temp: float, vib: float, err: float, hrs: float) -> Tuple[int, float, int]:
+    """
+    Numeric core of _rules. Returns (label index into _LABELS, confidence, factor bitmask)
+    where bit i set means rule i fired. Weights are added in table order, like _rules_batch.
+    """
+    score = 0.0
+    mask = 0
+    if temp >= _THRESH_T[0]:
+        score += _WEIGHTS_T[0]
+        mask |= 1
+    if vib >= _THRESH_T[1]:
+        score += _WEIGHTS_T[1]
+        mask |= 2
+    if err >= _THRESH_T[2]:
+        score += _WEIGHTS_T[2]
+        mask |= 4
+    if hrs >= _THRESH_T[3]:
+        score += _WEIGHTS_T[3]
+        mask |= 8
+    label = int(score >= 0.4) + int(score >= 0.7)
+    conf = min(0.9, 0.5 + score / 2.0)  # heuristic
+    return label, conf, mask
+
+if njit is not None:
+    # No fastmath: reassociating the score sum could move a row across a label boundary
+    _rules_kernel = njit(cache=True)(_rules_kernel)
+
 class RuleBasedAssessor:
     """
     Applies simple rules only as a fallback to Azure ML output.
@@ -16,36 +62,15 @@ class RuleBasedAssessor:
         Very simple example rules. Tweak as needed.
         Returns (label, confidence, factors)
         """
-        factors: List[str] = []
-        score = 0.0
-
-        temp = float(x.get("TemperatureC", 0))
-        vib  = float(x.get("VibrationMM_S", 0))
-        err  = float(x.get("ErrorLogsCount", 0))
-        hrs  = float(x.get("RuntimeHours", 0))
-
-        if temp >= 38.0:
-            score += 0.4
-            factors.append("High temperature")
-        if vib >= 0.05:
-            score += 0.3
-            factors.append("High vibration")
-        if err >= 3:
-            score += 0.4
-            factors.append("Frequent error logs")
-        if hrs >= 2000:
-            score += 0.2
-            factors.append("Long runtime")
-
-        if score >= 0.7:
-            label = "High"
-        elif score >= 0.4:
-            label = "Medium"
-        else:
-            label = "Low"
-
-        conf = min(0.9, 0.5 + score/2.0)  # heuristic
-        return label, conf, factors
+        get = x.get
+        label_idx, conf, mask = _rules_kernel(
+            float(get("TemperatureC", 0)),
+            float(get("VibrationMM_S", 0)),
+            float(get("ErrorLogsCount", 0)),
+            float(get("RuntimeHours", 0)),
+        )
+        factors: List[str] = [f for i, f in enumerate(_FACTORS) if mask >> i & 1]
+        return _LABELS[label_idx], float(conf), factors
 
     def refine_prediction(
         self,
@@ -74,6 +99,49 @@ class RuleBasedAssessor:
                 "factors": [],
             }
 
+    def _rules_batch(self, rows_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, List[List[str]]]:
+        """
+        _rules over every row of a DataFrame at once (missing values count as 0).
+        Returns (labels, confidences, factors per row)
+        """
+        T = rows_df.reindex(columns=list(_RULE_KEYS)).fillna(0).to_numpy(dtype=float)
+        mask = T >= _THRESH
+        # Accumulate column by column (not mask @ _WEIGHTS) so scores match _rules bit for bit
+        scores = np.zeros(len(T))
+        for j, w in enumerate(_WEIGHTS.tolist()):
+            scores += np.where(mask[:, j], w, 0.0)
+        labels = np.where(scores >= 0.7, "High", np.where(scores >= 0.4, "Medium", "Low"))
+        confs = np.minimum(0.9, 0.5 + scores / 2.0)
+        factors = [[f for f, m in zip(_FACTORS, row) if m] for row in mask.tolist()]
+        return labels, confs, factors
+
+    def refine_predictions_batch(
+        self,
+        rows_df: pd.DataFrame,
+        aml_labels: Sequence[Optional[str]],
+        aml_confs: Sequence[Optional[float]],
+    ) -> List[Dict[str, Any]]:
+        """
+        refine_prediction for N rows: the fallback mask and all rules are evaluated as
+        column operations, then each row takes either the AML result or the rules result.
+        """
+        labels = pd.Series(list(aml_labels), dtype=object)
+        confs = pd.to_numeric(pd.Series(list(aml_confs), dtype=object), errors="coerce")
+        use_rules = (labels.isna() | confs.isna() | (confs < self.conf_threshold)).to_numpy()
+
+        r_labels, r_confs, r_factors = self._rules_batch(rows_df)
+        r_labels, r_confs = r_labels.tolist(), r_confs.tolist()
+
+        out: List[Dict[str, Any]] = []
+        for i, fallback in enumerate(use_rules.tolist()):
+            if fallback:
+                out.append({"source": "rules_fallback", "label": r_labels[i],
+                            "confidence": r_confs[i], "factors": r_factors[i]})
+            else:
+                out.append({"source": "azure_ml", "label": aml_labels[i],
+                            "confidence": aml_confs[i], "factors": []})
+        return out
+
     # Convenience if you ever need rules directly
     def direct(self, telemetry_row: Dict[str, Any]) -> Dict[str, Any]:
         label, conf, factors = self._rules(telemetry_row)
@@ -1,6 +1,7 @@
 import os
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from azure.identity import ClientSecretCredential
 from azure.storage.blob import BlobServiceClient
@@ -24,6 +25,8 @@ DEPLOYMENT_NAME = os.getenv("AZURE_ML_DEPLOYMENT_NAME")
 
 BLOB_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
 CONTAINER_NAME = os.getenv("CONTAINER_NAME")
+# How many blobs test_blob_storage downloads (in parallel)
+BLOB_SAMPLE_COUNT = max(1, int(os.getenv("BLOB_SAMPLE_COUNT", "1")))
 
 # --------------------------
 # Authentication
@@ -79,11 +82,18 @@ def test_blob_storage():
         blobs = list(container_client.list_blobs())
         print(f"✅ Found {len(blobs)} blobs in container '{CONTAINER_NAME}'")
         if blobs:
-            first_blob = blobs[0].name
-            print("Downloading first blob:", first_blob)
-            blob_client = container_client.get_blob_client(first_blob)
-            data = blob_client.download_blob().readall()
-            print("First 500 chars:\n", data.decode("utf-8")[:500])
+            sample = blobs[:BLOB_SAMPLE_COUNT]
+            print(f"Downloading {len(sample)} blob(s), first: {sample[0].name}")
+
+            def _download(b):
+                # max_concurrency also splits one large blob into parallel range GETs
+                return container_client.get_blob_client(b.name).download_blob(max_concurrency=8).readall()
+
+            # Each download is network-bound, so threads overlap the round-trips
+            with ThreadPoolExecutor(max_workers=min(16, len(sample))) as ex:
+                results = list(ex.map(_download, sample))
+            print(f"✅ Downloaded {len(results)} blob(s), {sum(len(r) for r in results)} bytes")
+            print("First 500 chars:\n", results[0].decode("utf-8")[:500])
     except Exception as e:
         print("❌ Error accessing blob storage:", e)
 
@@ -1,5 +1,6 @@
 import os
 import json
+import functools
 from datetime import datetime
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
@@ -9,15 +10,32 @@ load_dotenv()
 BLOB_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
 CONTAINER_NAME = os.getenv("CONTAINER_NAME")
 
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=str)
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+# Clients are built once per connection string / container and reused across uploads
+@functools.lru_cache(maxsize=8)
+def _svc(conn: str) -> BlobServiceClient:
+    return BlobServiceClient.from_connection_string(conn)
+
+@functools.lru_cache(maxsize=8)
+def _container(conn: str, name: str):
+    return _svc(conn).get_container_client(name)
+
 def upload_prediction(result: dict):
-    blob_service = BlobServiceClient.from_connection_string(BLOB_CONNECTION_STRING)
-    container_client = blob_service.get_container_client(CONTAINER_NAME)
+    container_client = _container(BLOB_CONNECTION_STRING, CONTAINER_NAME)
 
     # filename with timestamp
     filename = f"prediction_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
 
     blob_client = container_client.get_blob_client(filename)
-    blob_client.upload_blob(json.dumps(result, indent=2), overwrite=True)
+    blob_client.upload_blob(_dumps(result), overwrite=True)
 
     print(f"✅ Uploaded prediction to blob: {filename}")
 
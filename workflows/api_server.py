@@ -3,15 +3,43 @@ import os
 import sys
 import json
 import asyncio
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 import logging
 
 from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 
+# orjson for response bodies and SSE frames when installed (numpy-aware, ~5x faster than stdlib)
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as _DefaultResponse
+
+    def _dumpb(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY, default=str)
+
+    def _dumps(obj: Any) -> str:
+        return _dumpb(obj).decode()
+except ImportError:
+    orjson = None
+    _DefaultResponse = JSONResponse
+
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, default=str)
+
+    def _dumpb(obj: Any) -> bytes:
+        return _dumps(obj).encode("utf-8")
+
+try:
+    from cachetools import TTLCache
+except ImportError:
+    TTLCache = None
+
 # Load environment variables
 load_dotenv()
 
@@ -19,14 +47,24 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import services
-from services.blob_storage import BlobStorage
+from services.blob_storage import (
+    BlobStorage,
+    PREDICTION_ROOT,
+    prediction_name_filter,
+    prediction_prefixes,
+    record_epoch,
+)
 from services.mqtt_service import MQTTService
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Medical Device Predictions API", version="1.0.0")
+app = FastAPI(
+    title="Medical Device Predictions API",
+    version="1.0.0",
+    default_response_class=_DefaultResponse,
+)
 
 # Enhanced CORS middleware for SSE support
 app.add_middleware(
@@ -42,6 +80,59 @@ app.add_middleware(
 blob_storage = BlobStorage()
 mqtt_service = MQTTService(client_id_prefix="api-server")
 
+# Shared pool for blob GETs: the list endpoints are round-trip bound, so fan them out.
+# Capped to stay under Azure Storage throttling limits.
+BLOB_DOWNLOAD_WORKERS = max(1, int(os.getenv("BLOB_DOWNLOAD_WORKERS", "16")))
+_DL_POOL = ThreadPoolExecutor(max_workers=BLOB_DOWNLOAD_WORKERS, thread_name_prefix="blob-dl")
+
+# Live stream: the stream pipeline re-publishes every finished record on this topic and
+# /api/stream fans it out to connected clients (no blob polling while MQTT is up)
+MQTT_PREDICTIONS_TOPIC = os.getenv("MQTT_PREDICTIONS_TOPIC", "iot/predictions")
+SSE_KEEPALIVE_SEC = float(os.getenv("SSE_KEEPALIVE_SEC", "15"))
+# Per-client buffer; a slow client loses its oldest events instead of growing memory
+SSE_QUEUE_MAXSIZE = max(1, int(os.getenv("SSE_QUEUE_MAXSIZE", "256")))
+
+# In-process view of the live stream for /api/devices and /api/stats:
+# device name -> latest record, plus risk counts over the last STATS_WINDOW predictions.
+# Only trusted while the MQTT feed is up; otherwise the endpoints rescan blob storage.
+STATS_WINDOW = 100
+LATEST: Dict[str, Dict[str, Any]] = {}
+RISK_COUNTS: Counter = Counter()
+_recent_labels: deque = deque()
+_view_lock = threading.Lock()
+# Newest record time folded in by the startup seed. The persistent MQTT session replays
+# predictions published while the API was down; those are already in blob storage (and
+# in the seed), so pushed records at or before this mark are dropped as duplicates.
+_seed_watermark: Optional[float] = None
+
+# Short-lived cache of serialized /api/predictions bodies keyed by query params, so a
+# dashboard polling with identical filters costs a dict lookup. Cleared on every pushed record.
+PREDICTIONS_CACHE_TTL_SEC = float(os.getenv("PREDICTIONS_CACHE_TTL_SEC", "2.0"))
+_predictions_cache = (
+    TTLCache(maxsize=256, ttl=PREDICTIONS_CACHE_TTL_SEC)
+    if TTLCache is not None and PREDICTIONS_CACHE_TTL_SEC > 0
+    else None
+)
+# The unfiltered "newest N records" scan is shared by /api/predictions, /api/devices and
+# /api/stats (and the view seed), so a dashboard refresh hitting all three scans once.
+RECENT_RECORDS_TTL_SEC = float(os.getenv("RECENT_RECORDS_TTL_SEC", "3.0"))
+_recent_cache = (
+    TTLCache(maxsize=4, ttl=RECENT_RECORDS_TTL_SEC)
+    if TTLCache is not None and RECENT_RECORDS_TTL_SEC > 0
+    else None
+)
+_cache_lock = threading.Lock()
+
+_subscribers: Set[asyncio.Queue] = set()
+_dropped: Dict[asyncio.Queue, int] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_push_enabled = False
+
+
+def _push_live() -> bool:
+    """Push feed usable right now: subscribed at startup and the subscriber is connected"""
+    return _push_enabled and mqtt_service.is_connected()
+
 # ---------------------------------------------------------------------
 # Helper Functions
 # ---------------------------------------------------------------------
@@ -61,6 +152,41 @@ def parse_time_filter(since: str) -> Optional[datetime]:
     else:
         return None
 
+def download_records(blobs: List) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Download blobs concurrently into (blob name, record) pairs, newest first.
+    NDJSON batch blobs expand to one pair per line; failed downloads are skipped.
+    """
+    names = [b.name for b in blobs]
+    return [
+        (name, record)
+        for name, records in zip(names, _DL_POOL.map(blob_storage.download_records, names))
+        for record in records
+    ]
+
+def recent_records(limit: int = 200) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Newest `limit` prediction records as (blob name, record), memoized briefly"""
+    if _recent_cache is not None:
+        with _cache_lock:
+            cached = _recent_cache.get(limit)
+        if cached is not None:
+            return cached
+    blobs = blob_storage.list_json_blobs(limit=limit)
+    pairs = download_records(blobs)[:limit]
+    if _recent_cache is not None:
+        with _cache_lock:
+            _recent_cache[limit] = pairs
+    return pairs
+
+# Telemetry fields returned to the frontend, with their defaults (merged over the record)
+_TELEM_DEFAULTS: Dict[str, Any] = dict.fromkeys((
+    "DeviceName", "DeviceType", "TemperatureC", "VibrationMM_S", "RuntimeHours",
+    "PressureKPa", "CurrentDrawA", "SignalNoiseLevel", "ClimateControl", "HumidityPercent",
+    "Location", "OperationalCycles", "UserInteractionsPerDay", "ApproxDeviceAgeYears",
+    "NumRepairs", "ErrorLogsCount", "SentTimestamp",
+)) | {"DeviceName": "Unknown", "DeviceType": "Unknown", "TemperatureC": 0, "VibrationMM_S": 0, "RuntimeHours": 0}
+_TELEM_KEYS = frozenset(_TELEM_DEFAULTS)
+
 def format_prediction_record(blob_name: str, record: Dict[str, Any]) -> Dict[str, Any]:
     """Format prediction record for frontend consumption"""
     telemetry = record.get("telemetry", {})
@@ -68,26 +194,17 @@ def format_prediction_record(blob_name: str, record: Dict[str, Any]) -> Dict[str
     azure_ml = record.get("azure_ml", {})
     local_model = record.get("local_model", {})
     
+    # One C-level merge over the defaults; only project field-by-field if the
+    # telemetry carries keys the frontend contract doesn't include
+    if telemetry.keys() <= _TELEM_KEYS:
+        telemetry_out = _TELEM_DEFAULTS | telemetry
+    else:
+        telemetry_out = {k: telemetry.get(k, d) for k, d in _TELEM_DEFAULTS.items()}
+    device_name = telemetry_out["DeviceName"]
+    device_type = telemetry_out["DeviceType"]
+    
     return {
-        "telemetry": {
-            "DeviceName": telemetry.get("DeviceName", "Unknown"),
-            "DeviceType": telemetry.get("DeviceType", "Unknown"),
-            "TemperatureC": telemetry.get("TemperatureC", 0),
-            "VibrationMM_S": telemetry.get("VibrationMM_S", 0),
-            "RuntimeHours": telemetry.get("RuntimeHours", 0),
-            "PressureKPa": telemetry.get("PressureKPa"),
-            "CurrentDrawA": telemetry.get("CurrentDrawA"),
-            "SignalNoiseLevel": telemetry.get("SignalNoiseLevel"),
-            "ClimateControl": telemetry.get("ClimateControl"),
-            "HumidityPercent": telemetry.get("HumidityPercent"),
-            "Location": telemetry.get("Location"),
-            "OperationalCycles": telemetry.get("OperationalCycles"),
-            "UserInteractionsPerDay": telemetry.get("UserInteractionsPerDay"),
-            "ApproxDeviceAgeYears": telemetry.get("ApproxDeviceAgeYears"),
-            "NumRepairs": telemetry.get("NumRepairs"),
-            "ErrorLogsCount": telemetry.get("ErrorLogsCount"),
-            "SentTimestamp": telemetry.get("SentTimestamp")
-        },
+        "telemetry": telemetry_out,
         "final": {
             "label": final.get("label", "Unknown"),
             "confidence": final.get("confidence", 0),
@@ -107,12 +224,101 @@ def format_prediction_record(blob_name: str, record: Dict[str, Any]) -> Dict[str
             "confidence": local_model.get("confidence"),
             "error": local_model.get("error")
         },
-        "timestamp": record.get("timestamp", datetime.now(timezone.utc).isoformat()),
+        "timestamp": record["timestamp"] if "timestamp" in record else datetime.now(timezone.utc).isoformat(),
         "pipeline": record.get("pipeline", "unknown"),
-        "device_name": telemetry.get("DeviceName", "Unknown"),  # Top level for easier access
-        "device_type": telemetry.get("DeviceType", "Unknown")   # Top level for easier access
+        "device_name": device_name,  # Top level for easier access
+        "device_type": device_type   # Top level for easier access
     }
 
+# ---------------------------------------------------------------------
+# Live prediction hub (MQTT -> per-client asyncio queues)
+# ---------------------------------------------------------------------
+
+def _view_apply(record: Dict[str, Any]) -> None:
+    """Fold one record (oldest first) into LATEST / RISK_COUNTS"""
+    device_name = (record.get("telemetry") or {}).get("DeviceName")
+    label = (record.get("final") or {}).get("label", "Unknown")
+    with _view_lock:
+        if device_name:
+            # Never roll a device back to an older record (late or replayed delivery)
+            current = LATEST.get(device_name)
+            current_ts = record_epoch(current) if current else None
+            record_ts = record_epoch(record)
+            if current_ts is None or record_ts is None or record_ts >= current_ts:
+                LATEST[device_name] = record
+        if len(_recent_labels) >= STATS_WINDOW:
+            RISK_COUNTS[_recent_labels.popleft()] -= 1
+        _recent_labels.append(label)
+        RISK_COUNTS[label] += 1
+
+def _view_load() -> None:
+    """Seed the view from the newest STATS_WINDOW blobs (blocking; run in an executor)"""
+    global _seed_watermark
+    for _, record in reversed(recent_records(STATS_WINDOW)):
+        if record:
+            _view_apply(record)
+            ts = record_epoch(record)
+            if ts is not None and (_seed_watermark is None or ts > _seed_watermark):
+                _seed_watermark = ts
+
+def _fan_out(record: Dict[str, Any], frame: bytes) -> None:
+    """Runs on the event loop: update the view and hand the SSE frame to every connected client"""
+    _view_apply(record)
+    with _cache_lock:
+        if _predictions_cache is not None:
+            _predictions_cache.clear()
+        if _recent_cache is not None:
+            _recent_cache.clear()
+    for q in list(_subscribers):
+        try:
+            q.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Drop-oldest: never block the hub on one slow client
+            try:
+                q.get_nowait()
+                q.put_nowait(frame)
+            except asyncio.QueueEmpty:
+                pass
+            dropped = _dropped.get(q, 0) + 1
+            _dropped[q] = dropped
+            if dropped == 1:
+                # Once per overflow episode; the client's "event: overflow" frame carries the count
+                logger.warning("SSE client too slow; dropping oldest events until it catches up")
+
+def _on_prediction(record: Optional[Dict[str, Any]]) -> None:
+    """
+    MQTT network-thread callback; never touch asyncio queues from here directly.
+    The record is formatted and serialized once, here, off the event loop; every SSE
+    client then just writes the same frame.
+    """
+    if not record or _loop is None:
+        return
+    if _seed_watermark is not None:
+        ts = record_epoch(record)
+        if ts is not None and ts <= _seed_watermark:
+            return  # replayed from the persistent session; already seeded from blob storage
+    frame = b"data: " + _dumpb(format_prediction_record("", record)) + b"\n\n"
+    _loop.call_soon_threadsafe(_fan_out, record, frame)
+
+@app.on_event("startup")
+async def start_prediction_hub():
+    global _loop, _push_enabled
+    _loop = asyncio.get_running_loop()
+    if not MQTT_PREDICTIONS_TOPIC:
+        return
+    # Seed before subscribing so an older stored record never overwrites a live one
+    try:
+        await _loop.run_in_executor(None, _view_load)
+    except Exception as e:
+        logger.error(f"Failed to seed prediction view: {e}")
+    _push_enabled = await _loop.run_in_executor(
+        None, mqtt_service.subscribe, MQTT_PREDICTIONS_TOPIC, _on_prediction
+    )
+    if _push_enabled:
+        logger.info(f"Streaming predictions from MQTT topic {MQTT_PREDICTIONS_TOPIC}")
+    else:
+        logger.warning("MQTT subscribe not acknowledged; endpoints fall back to blob storage")
+
 # ---------------------------------------------------------------------
 # API Routes (matching your frontend expectations)
 # ---------------------------------------------------------------------
@@ -128,55 +334,76 @@ def get_predictions(
     device: Optional[str] = Query(None, description="Filter by device name"),
     risk: Optional[str] = Query(None, description="Filter by risk level: Low, Medium, High"),
     limit: int = Query(50, ge=1, le=200, description="Maximum number of results")
-) -> List[Dict[str, Any]]:
+) -> Response:
     """
     Get predictions with optional filters - matches frontend expectation
     """
+    key = (since, device, risk, limit)
+    if _predictions_cache is not None:
+        with _cache_lock:
+            cached = _predictions_cache.get(key)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
     try:
-        # Get all recent blobs
-        blobs = blob_storage.list_json_blobs(limit=limit * 2)  # Get more to allow filtering
-        results = []
-        
         # Parse time filter
         time_filter = None
         if since:
             time_filter = parse_time_filter(since)
         
-        for blob in blobs:
-            record = blob_storage.download_json(blob.name)
+        if time_filter or device or risk:
+            # Push the filters into the listing: time -> partition prefixes, device/risk -> blob name
+            prefixes = prediction_prefixes(time_filter) if time_filter else PREDICTION_ROOT
+            blobs = blob_storage.list_json_blobs(
+                prefix=prefixes,
+                limit=limit * 2,  # Get more to allow filtering
+                name_filter=prediction_name_filter(device, risk, since=time_filter),
+            )
+            pairs = download_records(blobs)
+        else:
+            # Unfiltered: reuse the scan shared with /api/devices and /api/stats
+            pairs = recent_records(max(limit * 2, 100))
+        results = []
+        
+        # Hoist the comparators out of the loop
+        since_ts = time_filter.timestamp() if time_filter else None
+        device_lower = device.lower() if device else None
+        risk_lower = risk.lower() if risk else None
+        
+        for blob_name, record in pairs:
             if not record:
                 continue
                 
             # Apply time filter
-            if time_filter:
-                try:
-                    record_time = datetime.fromisoformat(record.get("timestamp", "").replace('Z', '+00:00'))
-                    if record_time < time_filter:
-                        continue
-                except (ValueError, TypeError):
+            if since_ts is not None:
+                record_ts = record_epoch(record)
+                if record_ts is None or record_ts < since_ts:
                     continue
             
             # Apply device filter
-            if device:
+            if device_lower:
                 device_name = record.get("telemetry", {}).get("DeviceName", "")
-                if device.lower() not in device_name.lower():
+                if device_lower not in device_name.lower():
                     continue
             
             # Apply risk filter
-            if risk:
+            if risk_lower:
                 risk_label = record.get("final", {}).get("label", "")
-                if risk.lower() != risk_label.lower():
+                if risk_lower != risk_label.lower():
                     continue
             
             # Format and add to results
-            formatted_record = format_prediction_record(blob.name, record)
+            formatted_record = format_prediction_record(blob_name, record)
             results.append(formatted_record)
             
             if len(results) >= limit:
                 break
         
         logger.info(f"Returning {len(results)} predictions")
-        return results
+        body = _dumpb(results)
+        if _predictions_cache is not None:
+            with _cache_lock:
+                _predictions_cache[key] = body
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Failed to fetch predictions: {e}")
@@ -187,27 +414,68 @@ async def stream_predictions():
     """
     Server-Sent Events endpoint for real-time predictions - matches frontend expectation
     """
+    async def latest_blob():
+        loop = asyncio.get_running_loop()
+        latest_blobs = await loop.run_in_executor(_DL_POOL, blob_storage.list_json_blobs, PREDICTION_ROOT, 1)
+        return latest_blobs[0] if latest_blobs else None
+
+    async def download_formatted(blob) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(_DL_POOL, blob_storage.download_records, blob.name)
+        return format_prediction_record(blob.name, records[0]) if records else None
+
     async def event_generator():
-        """Generate SSE events from MQTT or periodic polling"""
+        """Generate SSE events pushed from MQTT, or by periodic polling when MQTT is down"""
+        # Register before the initial fetch so nothing published in between is missed
+        q: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAXSIZE)
+        if _push_enabled:
+            _subscribers.add(q)
         try:
+            # (name, etag) of the last blob sent; the listing carries both, so an unchanged
+            # latest blob is skipped without downloading it again
+            last_seen = None
+            poll_now = True  # start every client off with the most recent stored prediction
+            idle = 0.0
             while True:
-                # Method 1: Try to get latest prediction from blob storage
+                if poll_now or not _push_live():
+                    poll_now = False
+                    try:
+                        blob = await latest_blob()
+                        if blob is not None and (blob.name, blob.etag) != last_seen:
+                            last_seen = (blob.name, blob.etag)
+                            formatted_record = await download_formatted(blob)
+                            if formatted_record:
+                                yield f"data: {_dumps(formatted_record)}\n\n"
+                    except Exception as e:
+                        logger.error(f"Error fetching latest prediction: {e}")
+
+                    if not _push_live():
+                        # MQTT feed down (or never up): poll until it is back
+                        await asyncio.sleep(5)  # Poll every 5 seconds
+                        continue
+
+                # Wake at least every 5 s to notice a dropped feed and fall back to polling
                 try:
-                    latest_blobs = blob_storage.list_json_blobs(limit=1)
-                    if latest_blobs:
-                        record = blob_storage.download_json(latest_blobs[0].name)
-                        if record:
-                            formatted_record = format_prediction_record(latest_blobs[0].name, record)
-                            yield f"data: {json.dumps(formatted_record)}\n\n"
-                except Exception as e:
-                    logger.error(f"Error fetching latest prediction: {e}")
-                
-                # Wait before next poll (adjust frequency as needed)
-                await asyncio.sleep(5)  # Poll every 5 seconds
+                    frame = await asyncio.wait_for(q.get(), timeout=min(SSE_KEEPALIVE_SEC, 5.0))
+                except asyncio.TimeoutError:
+                    idle += min(SSE_KEEPALIVE_SEC, 5.0)
+                    if idle >= SSE_KEEPALIVE_SEC:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"  # SSE comment; keeps proxies from closing idle streams
+                    continue
+                idle = 0.0
+                dropped = _dropped.pop(q, 0)
+                if dropped:
+                    # Tell the client it missed events so it can refetch /api/predictions
+                    yield f"event: overflow\ndata: {_dumps({'dropped': dropped})}\n\n"
+                yield frame
                 
         except Exception as e:
             logger.error(f"SSE stream error: {e}")
-            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            yield f"event: error\ndata: {_dumps({'error': str(e)})}\n\n"
+        finally:
+            _subscribers.discard(q)
+            _dropped.pop(q, None)
     
     return StreamingResponse(
         event_generator(),
@@ -228,12 +496,13 @@ async def stream_predictions():
 @app.get("/api/devices")
 def get_devices() -> List[str]:
     """Get list of all device names"""
+    if _push_live():
+        with _view_lock:
+            return sorted(LATEST)
     try:
-        blobs = blob_storage.list_json_blobs(limit=100)
         devices = set()
         
-        for blob in blobs:
-            record = blob_storage.download_json(blob.name)
+        for _, record in recent_records(100):
             if record:
                 device_name = record.get("telemetry", {}).get("DeviceName")
                 if device_name:
@@ -246,30 +515,29 @@ def get_devices() -> List[str]:
 @app.get("/api/stats")
 def get_dashboard_stats() -> Dict[str, Any]:
     """Get overall dashboard statistics"""
+    if _push_live():
+        with _view_lock:
+            return {
+                "total_devices": len(LATEST),
+                "risk_distribution": {k: RISK_COUNTS[k] for k in ("Low", "Medium", "High")},
+                "total_predictions": len(_recent_labels),
+                "last_updated": datetime.now(timezone.utc).isoformat()
+            }
     try:
-        blobs = blob_storage.list_json_blobs(limit=100)
-        stats = {
-            "total_devices": 0,
-            "risk_distribution": {"Low": 0, "Medium": 0, "High": 0},
-            "total_predictions": len(blobs),
-            "last_updated": datetime.now(timezone.utc).isoformat()
-        }
-        
-        devices = set()
+        pairs = recent_records(100)
+        records = [r for _, r in pairs if r]
         
-        for blob in blobs:
-            record = blob_storage.download_json(blob.name)
-            if record:
-                device_name = record.get("telemetry", {}).get("DeviceName")
-                if device_name:
-                    devices.add(device_name)
-                
-                risk_level = record.get("final", {}).get("label", "Unknown")
-                if risk_level in stats["risk_distribution"]:
-                    stats["risk_distribution"][risk_level] += 1
+        # One reduce pass each; no per-record branching
+        risk_counter = Counter((r.get("final") or {}).get("label") for r in records)
+        devices = {(r.get("telemetry") or {}).get("DeviceName") for r in records}
+        devices -= {None, ""}
         
-        stats["total_devices"] = len(devices)
-        return stats
+        return {
+            "total_devices": len(devices),
+            "risk_distribution": {k: risk_counter[k] for k in ("Low", "Medium", "High")},
+            "total_predictions": len(pairs),
+            "last_updated": datetime.now(timezone.utc).isoformat()
+        }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {str(e)}")
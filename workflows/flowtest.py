@@ -1,16 +1,23 @@
 # flowtest.py
 import os
+import sys
 import json
+import functools
 import joblib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import paho.mqtt.client as mqtt
 from azure.storage.blob import BlobServiceClient
-from datetime import datetime, UTC
 from dotenv import load_dotenv
 import pandas as pd
 
 from rule_fallback import local_or_rules   # our new fallback logic
 
+# Allow "services/..." imports when running directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.blob_storage import prediction_blob_name
+
 # ---------------- Load environment variables ----------------
 load_dotenv()
 
@@ -50,13 +57,28 @@ sample_input = {
 }
 
 # ---------------- Azure ML + Fallback Logic ----------------
-def predict_with_fallback(data: dict):
-    headers = {"Content-Type": "application/json"}
+# One keep-alive session for every scoring call (no new TCP/TLS handshake per message);
+# gateway errors are retried on the pooled connection
+def _make_session() -> requests.Session:
+    retry_kwargs = dict(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+    try:
+        retry = Retry(allowed_methods=frozenset({"POST"}), **retry_kwargs)
+    except TypeError:  # urllib3 < 1.26
+        retry = Retry(method_whitelist=frozenset({"POST"}), **retry_kwargs)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
     if API_KEY:
-        headers["Authorization"] = f"Bearer {API_KEY}"
+        session.headers["Authorization"] = f"Bearer {API_KEY}"
+    return session
 
+SESSION = _make_session()
+
+def predict_with_fallback(data: dict):
     try:
-        resp = requests.post(ENDPOINT_URL, headers=headers, json={"data": [data]})
+        resp = SESSION.post(ENDPOINT_URL, json={"data": [data]}, timeout=(3.05, 10))
         resp.raise_for_status()
         result = resp.json()
 
@@ -74,58 +96,65 @@ def predict_with_fallback(data: dict):
     return {"success": True, "predictions": [fallback_result]}
 
 # ---------------- Store in Blob ----------------
-def store_in_blob(result: dict):
+# Built once and reused, so repeated uploads share one connection pool
+@functools.lru_cache(maxsize=1)
+def _container():
+    blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
+    return blob_service.get_container_client(CONTAINER_NAME)
+
+def _risk_label(result: dict):
+    preds = result.get("predictions") or []
+    first = preds[0] if preds else None
+    return first.get("label") if isinstance(first, dict) else first
+
+def store_in_blob(result: dict, device_name=None):
     try:
-        blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
-        container = blob_service.get_container_client(CONTAINER_NAME)
+        container = _container()
 
-        filename = f"prediction_{datetime.now(UTC).strftime('%Y%m%d_%H%M%S')}.json"
+        # Same partitioned naming as the stream pipeline, so time/device/risk filters find it
+        filename = prediction_blob_name(device_name, _risk_label(result))
         container.upload_blob(name=filename, data=json.dumps(result), overwrite=True)
         print(f"✅ Stored prediction in blob: {filename}")
     except Exception as e:
         print("❌ Blob storage error:", e)
 
-# ---------------- MQTT Producer ----------------
-def publish_mqtt(data: dict):
-    print("\n📡 Publishing telemetry to MQTT...")
+# ---------------- MQTT Round Trip ----------------
+def run_mqtt_pipeline(data: dict):
+    """
+    Publish the telemetry and consume it back over ONE MQTT connection:
+    connect -> subscribe -> (SUBACK) publish -> on message: predict + store -> disconnect.
+    """
+    print("\n📡 Connecting to MQTT...")
     client = mqtt.Client()
     client.username_pw_set(USERNAME, PASSWORD)
     client.tls_set()
 
     def on_connect(client, userdata, flags, rc, properties=None):
         print("✅ MQTT Connected with result code", rc)
-        client.publish(TOPIC, json.dumps(data))
-        print(f"✅ Published to MQTT: {json.dumps(data)}")
-        client.disconnect()
-
-    client.on_connect = on_connect
-    client.connect(BROKER, PORT, 60)
-    client.loop_forever()
-
-# ---------------- MQTT Consumer ----------------
-def consume_mqtt():
-    print("\n📡 Listening for MQTT message...")
-    client = mqtt.Client()
-    client.username_pw_set(USERNAME, PASSWORD)
-    client.tls_set()
-
-    def on_connect(client, userdata, flags, rc, properties=None):
-        print("✅ MQTT Receiver connected with result code", rc)
+        print("\n📡 Listening for MQTT message...")
         client.subscribe(TOPIC)
 
+    def on_subscribe(client, userdata, mid, granted_qos, properties=None):
+        # Subscription is live, so our own publish is delivered back to us
+        print("\n📡 Publishing telemetry to MQTT...")
+        payload = json.dumps(data)
+        client.publish(TOPIC, payload)
+        print(f"✅ Published to MQTT: {payload}")
+
     def on_message(client, userdata, msg):
         print("📨 Received MQTT message")
-        data = json.loads(msg.payload.decode())
+        received = json.loads(msg.payload.decode())
 
         # run prediction pipeline (ML → Local → Rules)
-        result = predict_with_fallback(data)
+        result = predict_with_fallback(received)
 
         # store prediction
-        store_in_blob(result)
+        store_in_blob(result, received.get("DeviceName"))
 
         client.disconnect()
 
     client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
     client.on_message = on_message
     client.connect(BROKER, PORT, 60)
     client.loop_forever()
@@ -133,11 +162,8 @@ def consume_mqtt():
 # ---------------- Run Pipeline ----------------
 if __name__ == "__main__":
     try:
-        # Step 1: Publish input
-        publish_mqtt(sample_input)
-
-        # Step 2: Consume + Predict + Store
-        consume_mqtt()
+        # Publish input, then Consume + Predict + Store on the same connection
+        run_mqtt_pipeline(sample_input)
 
     except KeyboardInterrupt:
         print("🛑 Workflow stopped by user")
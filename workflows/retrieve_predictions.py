@@ -2,8 +2,10 @@ import os
 import sys
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
+import numpy as np
 from dotenv import load_dotenv
 
 # Ensure services can be imported
@@ -11,7 +13,16 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 load_dotenv()
 
-from services.blob_storage import BlobStorage
+from services.blob_storage import (
+    BlobStorage,
+    PREDICTION_ROOT,
+    prediction_name_filter,
+    prediction_prefixes,
+    record_epoch,
+)
+
+# Concurrent blob GETs; listing is cheap, the per-blob round-trips are not.
+BLOB_DOWNLOAD_WORKERS = max(1, int(os.getenv("BLOB_DOWNLOAD_WORKERS", "16")))
 
 
 def extract_summary(blob_name: str, record: Dict[str, Any]) -> str:
@@ -30,6 +41,30 @@ def extract_summary(blob_name: str, record: Dict[str, Any]) -> str:
     return f"{blob_name} | {device_name} ({device_type}) | Risk: {risk} | Confidence: {conf} | Time: {ts}"
 
 
+def filter_mask(
+    records: List[Optional[Dict[str, Any]]],
+    since_ts: Optional[float] = None,
+    device_lower: Optional[str] = None,
+    risk_lower: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Boolean mask over a downloaded batch: each filter is one column extraction plus one
+    array comparison. Records without a parseable time are kept.
+    """
+    mask = np.fromiter((bool(r) for r in records), dtype=bool, count=len(records))
+    rows = [r or {} for r in records]
+    if since_ts is not None:
+        ts = np.array([record_epoch(r) if r else None for r in rows], dtype=float)  # None -> NaN
+        mask &= ~(ts < since_ts)
+    if device_lower:
+        names = np.array([str(r.get("telemetry", {}).get("DeviceName", "")) for r in rows], dtype=str)
+        mask &= np.char.lower(names) == device_lower
+    if risk_lower:
+        labels = np.array([str(r.get("final", {}).get("label", "")) for r in rows], dtype=str)
+        mask &= np.char.lower(labels) == risk_lower
+    return mask
+
+
 def list_predictions(
     since: Optional[datetime] = None,
     device_name: Optional[str] = None,
@@ -40,31 +75,31 @@ def list_predictions(
     Fetch and filter predictions from blob storage.
     """
     blob = BlobStorage()
-    blobs = blob.list_json_blobs(limit=200)
+    blobs = blob.list_json_blobs(
+        prefix=prediction_prefixes(since) if since else PREDICTION_ROOT,
+        limit=200,
+        name_filter=prediction_name_filter(device_name, risk, since=since),
+    )
+
+    # (blob name, record) pairs, newest first; NDJSON batch blobs expand to one pair per line
+    names = [b.name for b in blobs]
+    with ThreadPoolExecutor(max_workers=min(BLOB_DOWNLOAD_WORKERS, max(1, len(blobs)))) as ex:
+        pairs = [(n, r) for n, rs in zip(names, ex.map(blob.download_records, names)) for r in rs]
+    records = [r for _, r in pairs]
+
+    if not records:
+        return []
+
+    mask = filter_mask(
+        records,
+        since_ts=since.timestamp() if since else None,
+        device_lower=device_name.lower() if device_name else None,
+        risk_lower=risk.lower() if risk else None,
+    )
 
     results = []
-    for b in blobs:
-        record = blob.download_json(b.name)
-        if not record:
-            continue
-
-        ts_str = record.get("timestamp")
-        try:
-            ts = datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
-        except Exception:
-            ts = None
-
-        # Apply filters
-        if since and ts and ts < since:
-            continue
-        if device_name and str(record.get("telemetry", {}).get("DeviceName", "")).lower() != device_name.lower():
-            continue
-        if risk and str(record.get("final", {}).get("label", "")).lower() != risk.lower():
-            continue
-
-        results.append(extract_summary(b.name, record))
-        if len(results) >= limit:
-            break
+    for i in np.flatnonzero(mask)[:limit]:
+        results.append(extract_summary(pairs[i][0], records[i]))
 
     return results
 
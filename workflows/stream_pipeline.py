@@ -4,6 +4,8 @@ import sys
 import time
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from itertools import cycle
@@ -16,7 +18,7 @@ from services.mqtt_service import MQTTService
 from services.azure_ml_client import AzureMLClient
 from services.local_model import LocalModel
 from services.rule_fallback import RuleBasedAssessor
-from services.blob_storage import BlobStorage
+from services.blob_storage import BlobStorage, prediction_batch_name, prediction_blob_name
 from services.random_generator import generate_random_payload, device_mapping  # updated
 
 # Presentation helpers
@@ -24,12 +26,25 @@ from presentation.logging_config import setup_logging
 from presentation.presenter import present_step, present_final
 
 
+# Structured per-record log frames; orjson when installed
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:
+    def _dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), default=str)
+
+
 # ---------------------------------------------------------------------
 # Setup logging & environment
 # ---------------------------------------------------------------------
 load_dotenv()
 log_mode = setup_logging()
 logger = logging.getLogger(__name__)
+# Per-record step lines are for demos; other modes get one structured frame per record
+PRESENTING = (log_mode == "presentation")
 
 # Quiet noisy libs in presentation mode
 if (os.getenv("LOG_MODE", "presentation").strip().lower() == "presentation"):
@@ -52,10 +67,19 @@ if (os.getenv("LOG_MODE", "presentation").strip().lower() == "presentation"):
 # ---------------------------------------------------------------------
 MQTT_TLS = os.getenv("MQTT_TLS", "true").strip().lower() != "false"
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "iot/devices")
+# Finished prediction records are re-published here for the API's live stream (empty = off)
+MQTT_PREDICTIONS_TOPIC = os.getenv("MQTT_PREDICTIONS_TOPIC", "iot/predictions")
 
 PUBLISH_INTERVAL_SEC = float(os.getenv("STREAM_PUBLISH_INTERVAL_SEC", "2.0"))
 RECEIVE_TIMEOUT_SEC = float(os.getenv("STREAM_RECEIVE_TIMEOUT_SEC", "30.0"))
 
+# Archive batching: >1 buffers records and uploads them as one NDJSON blob per batch
+# (flushed at this size or once the oldest buffered record is this old). 1 = one blob per record.
+ARCHIVE_BATCH_SIZE = max(1, int(os.getenv("STREAM_ARCHIVE_BATCH_SIZE", "1")))
+ARCHIVE_FLUSH_SEC = float(os.getenv("STREAM_ARCHIVE_FLUSH_SEC", "30"))
+# Records kept while uploads keep failing; beyond this the oldest are dropped (and logged)
+ARCHIVE_BUFFER_MAX = max(ARCHIVE_BATCH_SIZE, int(os.getenv("STREAM_ARCHIVE_BUFFER_MAX", str(ARCHIVE_BATCH_SIZE * 10))))
+
 # New: limit stream by cycles (1 cycle = all devices once)
 MAX_CYCLES = os.getenv("STREAM_MAX_CYCLES")
 MAX_CYCLES = int(MAX_CYCLES) if (MAX_CYCLES and MAX_CYCLES.isdigit()) else None
@@ -73,6 +97,9 @@ mqtt = MQTTService(
     client_id_prefix="stream"
 )
 
+# Each record's blob upload/publish overlaps with receiving and scoring the next one
+_io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stream-io")
+
 
 # ---------------------------------------------------------------------
 # Helpers
@@ -89,10 +116,81 @@ def choose_final(telemetry, aml_result, local_result):
     }
 
 
+_archive_buffer = []
+_archive_started = [0.0]
+# Appends run on the I/O pool, deadline flushes on the receive loop
+_archive_lock = threading.Lock()
+
+
+def flush_archive():
+    """Upload buffered records as one NDJSON blob; kept buffered if the upload fails."""
+    with _archive_lock:
+        if not _archive_buffer:
+            return None
+        fn = prediction_batch_name()
+        blob.upload_ndjson(fn, _archive_buffer)
+        _archive_buffer.clear()
+        return fn
+
+
+def flush_archive_if_due():
+    """Flush a partial batch whose oldest record has waited ARCHIVE_FLUSH_SEC."""
+    with _archive_lock:
+        due = bool(_archive_buffer) and time.monotonic() - _archive_started[0] >= ARCHIVE_FLUSH_SEC
+    return flush_archive() if due else None
+
+
 def archive_to_blob(record):
-    fn = "prediction"
-    blob.upload_json(fn, record)
-    return fn
+    if ARCHIVE_BATCH_SIZE <= 1:
+        final = record.get("final") or {}
+        fn = prediction_blob_name(record.get("device_name"), final.get("label"))
+        blob.upload_json("prediction", record, name=fn)
+        return fn
+
+    with _archive_lock:
+        if not _archive_buffer:
+            _archive_started[0] = time.monotonic()
+        _archive_buffer.append(record)
+        overflow = len(_archive_buffer) - ARCHIVE_BUFFER_MAX
+        if overflow > 0:
+            # Uploads have been failing for a while; don't grow without bound
+            del _archive_buffer[:overflow]
+            logger.error("Archive buffer full (%d records); dropped %d oldest unarchived record(s)",
+                         ARCHIVE_BUFFER_MAX, overflow)
+        full = len(_archive_buffer) >= ARCHIVE_BATCH_SIZE
+    if full:
+        return flush_archive()
+    return flush_archive_if_due()
+
+
+def publish_prediction(record):
+    if not MQTT_PREDICTIONS_TOPIC:
+        return False
+    return mqtt.publish_once(MQTT_PREDICTIONS_TOPIC, record, qos=1, retain=False, timeout=8.0)
+
+
+def persist_record(record):
+    """
+    Re-publish for live consumers, then archive to blob storage (runs on the I/O pool).
+    Publishing first means a blob outage never starves the live feed; archive errors
+    still propagate to _wait_persisted.
+    """
+    try:
+        publish_prediction(record)
+    except Exception as e:
+        logger.error("Prediction publish failed: %s", e)
+    return archive_to_blob(record)
+
+
+def _wait_persisted(future):
+    """Surface the outcome of the previous record's upload before starting another."""
+    if future is None:
+        return
+    try:
+        if future.result() is not None and PRESENTING:  # None: buffered for the next batch upload
+            present_step("Uploaded prediction to blob storage")
+    except Exception as e:
+        logger.error("Blob upload failed: %s", e)
 
 
 def publisher_loop(stop_flag: list, devices):
@@ -120,8 +218,8 @@ def run_stream(devices):
 
     stop_flag = [False]
     t = None
+    persist_future = None
     try:
-        import threading
         t = threading.Thread(target=publisher_loop, args=(stop_flag, devices), daemon=True)
         t.start()
 
@@ -133,29 +231,47 @@ def run_stream(devices):
 
             # one cycle = process each device once
             for _ in devices:
-                present_step("Waiting for telemetry message")
+                if PRESENTING:
+                    present_step("Waiting for telemetry message")
                 telemetry = receive_one()
                 if telemetry is None:
-                    present_step("No telemetry received in time (will keep listening)", level="warn")
+                    present_step("No telemetry received in time (will keep listening)", status="warn")
+                    # Telemetry stalled: don't let a partial batch sit in memory past its deadline
+                    try:
+                        flush_archive_if_due()
+                    except Exception as e:
+                        logger.error("Archive flush failed: %s", e)
                     continue
 
-                present_step("Telemetry received")
+                t0 = time.perf_counter()
+                if PRESENTING:
+                    present_step("Telemetry received")
 
                 try:
-                    present_step("Invoking cloud AI model")
+                    if PRESENTING:
+                        present_step("Invoking cloud AI model")
                     aml_result = azure_client.predict(telemetry)
                 except Exception as e:
                     logger.error("Cloud inference failed: %s", e)
                     aml_result = {"ok": False, "label": None, "confidence": None, "error": str(e)}
-
-                try:
-                    present_step("Evaluating with local model")
-                    local_result = local_model.predict(telemetry)
-                except Exception as e:
-                    logger.error("Local model failed: %s", e)
-                    local_result = {"ok": False, "label": None, "confidence": None, "error": str(e)}
-
-                present_step("Applying fallback rules")
+                t1 = time.perf_counter()
+
+                # choose_final only falls back to the local label/confidence when the cloud
+                # result lacks them, so skip local inference when the cloud answered fully
+                if aml_result.get("ok") and aml_result.get("label") and aml_result.get("confidence"):
+                    local_result = {"ok": False, "label": None, "confidence": None, "error": "skipped"}
+                else:
+                    try:
+                        if PRESENTING:
+                            present_step("Evaluating with local model")
+                        local_result = local_model.predict(telemetry)
+                    except Exception as e:
+                        logger.error("Local model failed: %s", e)
+                        local_result = {"ok": False, "label": None, "confidence": None, "error": str(e)}
+                t2 = time.perf_counter()
+
+                if PRESENTING:
+                    present_step("Applying fallback rules")
                 
                 device_name = telemetry.get("DeviceName")
                 device_type = telemetry.get("DeviceType")
@@ -165,8 +281,10 @@ def run_stream(devices):
                 # Add identity into final prediction
                 final["device_name"] = device_name
                 final["device_type"] = device_type
+                t3 = time.perf_counter()
 
-                present_step("AI decision computed")
+                if PRESENTING:
+                    present_step("AI decision computed")
 
                 record = {
                     "telemetry": telemetry,
@@ -176,20 +294,43 @@ def run_stream(devices):
                     "device_name": device_name,   # top-level identity
                     "device_type": device_type,   # top-level identity
                     "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "ts_epoch": time.time(),  # numeric copy of timestamp for cheap time filters
                     "pipeline": "mqtt_stream_roundrobin"
                 }
 
 
-                archive_to_blob(record)
-                present_step("Uploaded prediction to blob storage")
+                # At most one upload in flight: wait for the previous one, then hand this
+                # record off and go straight back to receiving
+                _wait_persisted(persist_future)
+                persist_future = _io_pool.submit(persist_record, record)
+                t4 = time.perf_counter()
                 present_final(record, log_mode=log_mode)
 
+                if not PRESENTING:
+                    step_trace = {
+                        "device": device_name,
+                        "label": final.get("label"),
+                        "aml_ok": bool(aml_result.get("ok")),
+                        "local": local_result.get("error") != "skipped",
+                        "aml_ms": round((t1 - t0) * 1000, 2),
+                        "local_ms": round((t2 - t1) * 1000, 2),
+                        "rules_ms": round((t3 - t2) * 1000, 2),
+                        "archive_wait_ms": round((t4 - t3) * 1000, 2),
+                        "total_ms": round((time.perf_counter() - t0) * 1000, 2),
+                    }
+                    logger.info("record %s", _dumps(step_trace), extra={"trace": step_trace})
+
             cycles_done += 1
 
     except KeyboardInterrupt:
         present_step("Keyboard interrupt received. Stopping stream.")
     finally:
         stop_flag[0] = True
+        _wait_persisted(persist_future)
+        try:
+            flush_archive()
+        except Exception as e:
+            logger.error("Final archive flush failed: %s", e)
         if t and t.is_alive():
             t.join(timeout=2.0)
 